@@ -0,0 +1,300 @@
+"""
+Structured representation of the captured HTTP requests and the store that
+keeps them in the kernel.
+"""
+import heapq
+import struct
+from bisect import bisect_left
+from datetime import datetime
+from fnmatch import fnmatchcase
+from dataclasses import dataclass, field
+from collections import deque
+from typing import Iterable, Iterator
+
+# Time of the request that prefixes raw request in the record.
+TIMESTAMP = struct.Struct("<d")
+# Part of the request where the end of the head is searched for.
+_HEAD_SEARCH = 2 ** 16
+
+
+def parse_head(head: bytes | memoryview) -> tuple[str, dict[str, str]]:
+    """
+    Parses the head of the HTTP request.
+
+    Parameters
+    ----------
+    head: bytes | memoryview
+        Request line and headers, including the final empty line.
+
+    Returns
+    -------
+    tuple[str, dict[str, str]]
+        Request line and headers with lower cased names.
+    """
+    request_line, *lines = str(head, "latin1").split("\r\n")
+    headers = {}
+    for line in lines:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return request_line, headers
+
+
+def _dechunk(data: bytes) -> bytes:
+    """
+    Body of the request in chunked transfer encoding without chunks framing.
+    Incomplete body is returned as far as it can be parsed.
+    """
+    body = bytearray()
+    pos = 0
+    while True:
+        end = data.find(b"\r\n", pos)
+        if end < 0:
+            break
+        try:
+            size = int(data[pos:end].split(b";", 1)[0].strip(), 16)
+        except ValueError:
+            break
+        if size == 0:
+            break
+        body += data[end + 2:end + 2 + size]
+        pos = end + 4 + size
+    return bytes(body)
+
+
+@dataclass(frozen=True)
+class CapturedRequest:
+    """
+    Parsed HTTP request.
+
+    Attributes
+    ----------
+    time: float
+        Unix time when the request was completely received.
+    method: str
+        HTTP method.
+    path: str
+        Path of the request without the query string.
+    query: str
+        Query string of the request.
+    version: str
+        HTTP version.
+    headers: dict[str, str]
+        Headers with lower cased names.
+    body: bytes
+        Body of the request, chunked transfer encoding is decoded.
+    size: int
+        Size of the raw request in bytes.
+    """
+    time: float
+    method: str
+    path: str
+    query: str
+    version: str
+    headers: dict[str, str] = field(repr=False)
+    body: bytes = field(repr=False)
+    size: int
+
+    @classmethod
+    def parse(
+        cls,
+        raw: bytes | memoryview,
+        time: float
+    ) -> "CapturedRequest":
+        """
+        Parses raw HTTP request.
+
+        Parameters
+        ----------
+        raw: bytes | memoryview
+            Request as it was received.
+        time: float
+            Unix time when the request was received.
+        """
+        with memoryview(raw) as view:
+            size = len(view)
+            head_end = bytes(view[:_HEAD_SEARCH]).find(b"\r\n\r\n")
+            if head_end < 0:
+                head_end = size
+                body = b""
+            else:
+                body = bytes(view[head_end + 4:])
+            request_line, headers = parse_head(view[:head_end])
+
+        method, _, rest = request_line.partition(" ")
+        target, _, version = rest.rpartition(" ")
+        if not target:
+            target, version = version, ""
+        path, _, query = target.partition("?")
+
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            body = _dechunk(body)
+
+        return cls(
+            time=time,
+            method=method.upper(),
+            path=path,
+            query=query,
+            version=version,
+            headers=headers,
+            body=body,
+            size=size
+        )
+
+
+class _Index:
+    """
+    Records of one key of the index in order of arrival. Evicted records are
+    removed from the beginning.
+    """
+
+    def __init__(self):
+        self.records: list[CapturedRequest] = []
+        self.times: list[float] = []
+        self.start = 0
+
+    def append(self, record: CapturedRequest) -> None:
+        self.records.append(record)
+        self.times.append(record.time)
+
+    def evict(self) -> None:
+        self.start += 1
+        if self.start > 1024 and self.start * 2 > len(self.records):
+            del self.records[:self.start]
+            del self.times[:self.start]
+            self.start = 0
+
+    def __len__(self) -> int:
+        return len(self.records) - self.start
+
+    def since(self, time: float) -> Iterator[CapturedRequest]:
+        start = bisect_left(self.times, time, lo=self.start)
+        return iter(self.records[start:])
+
+
+def _timestamp(value: float | datetime | None) -> float | None:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return value
+
+
+class CaptureStore:
+    """
+    Bounded store of the captured requests with indexes by path and method.
+    The oldest requests are evicted when one of the limits is exceeded.
+
+    Parameters
+    ----------
+    max_requests: int
+        Maximum number of the stored requests.
+    max_bytes: int
+        Maximum total size of the stored requests.
+    """
+
+    def __init__(self, max_requests: int = 100000, max_bytes: int = 2 ** 28):
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evicted = 0
+        self._records: deque[CapturedRequest] = deque()
+        self._by_path: dict[str, _Index] = {}
+        self._by_method: dict[str, _Index] = {}
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def add(self, record: CapturedRequest) -> None:
+        self._records.append(record)
+        self._by_path.setdefault(record.path, _Index()).append(record)
+        self._by_method.setdefault(record.method, _Index()).append(record)
+        self.size += record.size
+
+        while self._records and (
+            len(self._records) > self.max_requests
+            or self.size > self.max_bytes
+        ):
+            self._evict()
+
+    def _evict(self) -> None:
+        record = self._records.popleft()
+        self.size -= record.size
+        self.evicted += 1
+        for index, key in (
+            (self._by_path, record.path),
+            (self._by_method, record.method)
+        ):
+            index[key].evict()
+            if not index[key]:
+                del index[key]
+
+    def clear(self) -> None:
+        self._records.clear()
+        self._by_path.clear()
+        self._by_method.clear()
+        self.size = 0
+
+    def query(
+        self,
+        path: str | None = None,
+        method: str | None = None,
+        since: float | datetime | None = None,
+        until: float | datetime | None = None
+    ) -> list[CapturedRequest]:
+        """
+        Captured requests that match all given conditions, in order of
+        arrival.
+
+        Parameters
+        ----------
+        path: str | None
+            Path of the request, can be a glob pattern like "/api/*".
+        method: str | None
+            HTTP method.
+        since: float | datetime | None
+            Requests received at this time or later.
+        until: float | datetime | None
+            Requests received before this time.
+
+        Returns
+        -------
+        list[CapturedRequest]
+        """
+        since = _timestamp(since)
+        until = _timestamp(until)
+        start = float("-inf") if since is None else since
+
+        candidates: Iterable[CapturedRequest]
+        if path is not None and not any(char in path for char in "*?["):
+            index = self._by_path.get(path)
+            candidates = [] if index is None else index.since(start)
+            path = None
+        elif method is not None:
+            method = method.upper()
+            index = self._by_method.get(method)
+            candidates = [] if index is None else index.since(start)
+            method = None
+        elif path is not None:
+            candidates = heapq.merge(
+                *(
+                    index.since(start)
+                    for key, index in self._by_path.items()
+                    if fnmatchcase(key, path)
+                ),
+                key=lambda record: record.time
+            )
+            path = None
+        else:
+            candidates = (
+                record for record in self._records if record.time >= start
+            )
+
+        ans = []
+        for record in candidates:
+            if until is not None and record.time >= until:
+                break
+            if path is not None and not fnmatchcase(record.path, path):
+                continue
+            if method is not None and record.method != method.upper():
+                continue
+            ans.append(record)
+        return ans
@@ -4,58 +4,257 @@ some content it prints the contents as the cell output.
 Could be useful for researching the tools that thransfer content through
 network.
 """
-import socket
+import time
+import asyncio
 import logging
 import multiprocessing as mp
 
+from traitlets import Float, Int
 from ipykernel.ipkernel import IPythonKernel
 
+from .ring_buffer import RingBuffer
+from .capture import TIMESTAMP, CapturedRequest, CaptureStore, parse_head
+
 logger = logging.getLogger(__name__)
 
+RESPONSE = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/plain\r\n"
+    b"Content-Length: 0\r\n"
+    b"\r\n"
+)
+CONTINUE = b"HTTP/1.1 100 Continue\r\n\r\n"
+# Maximum size of the request head and chunk headers.
+HEAD_LIMIT = 2 ** 20
 
-def run_server(log_queue, host="0.0.0.0", port=8080):
+
+async def _read_chunked(
+    reader: asyncio.StreamReader,
+    raw: bytearray
+) -> None:
     """
-    Runs raw HTTP listener and sends printed data to the
-    parent via queue.
+    Reads body in chunked transfer encoding to the `raw` as is, including
+    chunk sizes and trailers.
     """
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((host, port))
-        s.listen(5)
+    while True:
+        size_line = await reader.readuntil(b"\r\n")
+        raw += size_line
+        size = int(size_line.split(b";", 1)[0].strip(), 16)
+        if size == 0:
+            break
+        raw += await reader.readexactly(size + 2)
 
-        while True:
-            conn, addr = s.accept()
-            with conn:
-
-                raw = b""
-                conn.settimeout(1.0)
-
-                try:
-                    while True:
-                        chunk = conn.recv(4096)
-                        if not chunk:
-                            break
-                        raw += chunk
-                except socket.timeout:
-                    pass
-
-                try:
-                    log_queue.put(raw.decode("latin1"))
-                except Exception as e:
-                    log_queue.put(f"Decode error: {e}")
-
-                resp = (
-                    "HTTP/1.1 200 OK\r\n"
-                    "Content-Type: text/plain\r\n"
-                    "Content-Length: 0"
+    while True:
+        trailer = await reader.readuntil(b"\r\n")
+        raw += trailer
+        if trailer == b"\r\n":
+            break
+
+
+async def _read_request(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    capacity: int = HEAD_LIMIT
+) -> tuple[bytes | bytearray, bool]:
+    """
+    Reads one HTTP request from the connection. End of the request is
+    determined by "Content-Length" or chunked transfer encoding. Request
+    with the invalid "Content-Length" ends with its head and closes the
+    connection.
+
+    Parameters
+    ----------
+    reader: asyncio.StreamReader
+        Reader of the connection.
+    writer: asyncio.StreamWriter
+        Writer of the connection, used for "100 Continue" response.
+    capacity: int
+        Maximum number of bytes allocated for the request in advance, the
+        rest of the body is appended as it arrives.
+
+    Returns
+    -------
+    tuple[bytes | bytearray, bool]
+        - Raw bytes of the request, received part of it if reading has
+          failed.
+        - Whether the connection can be used for the next request.
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        return e.partial, False
+
+    request_line, headers = parse_head(head)
+    keep_alive = (
+        headers.get("connection", "").lower() != "close"
+        and not request_line.endswith("HTTP/1.0")
+    )
+    if headers.get("expect", "").lower() == "100-continue":
+        writer.write(CONTINUE)
+
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raw = bytearray(head)
+        try:
+            await _read_chunked(reader, raw)
+        except (asyncio.IncompleteReadError, ValueError):
+            keep_alive = False
+        except Exception:
+            logger.exception("Failed to read the chunked body.")
+            keep_alive = False
+        return raw, keep_alive
+
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        length = -1
+    if length < 0:
+        # The end of the body is unknown, so is the start of the next
+        # request.
+        return head, False
+
+    total = len(head) + length
+    # Body is collected in the preallocated buffer, the part that doesn't
+    # fit is appended.
+    raw = bytearray(max(len(head), min(total, capacity)))
+    view = memoryview(raw)
+    view[:len(head)] = head
+    received = len(head)
+    try:
+        while received < total:
+            chunk = await reader.read(total - received)
+            if not chunk:
+                keep_alive = False
+                break
+            end = received + len(chunk)
+            if end <= len(raw):
+                view[received:end] = chunk
+            else:
+                view.release()
+                del raw[received:]
+                raw += chunk
+            received = end
+    except ConnectionError:
+        keep_alive = False
+    except Exception:
+        logger.exception("Failed to read the body of the request.")
+        keep_alive = False
+    finally:
+        view.release()
+    del raw[received:]
+
+    return raw, keep_alive
+
+
+async def _handle_connection(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    log_queue
+) -> None:
+    """
+    Serves all requests of the connection, raw bytes of each request
+    prefixed with the time of receiving are put to the queue once it is
+    completely received. The connection is counted in `log_queue.connections`
+    while it is open.
+    """
+    log_queue.connections += 1
+    try:
+        keep_alive = True
+        while keep_alive:
+            try:
+                raw, keep_alive = await _read_request(
+                    reader, writer, capacity=log_queue.capacity
                 )
-                conn.sendall(resp.encode("latin1"))
+            except asyncio.LimitOverrunError:
+                raw, keep_alive = await reader.read(HEAD_LIMIT), False
+            except ConnectionError:
+                raise
+            except Exception:
+                logger.exception("Failed to read the request.")
+                break
+            if not raw:
+                break
+
+            log_queue.put(TIMESTAMP.pack(time.time()), raw)
+
+            writer.write(RESPONSE)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+        log_queue.connections -= 1
+
+
+async def _serve(log_queue, host: str, port: int) -> None:
+    server = await asyncio.start_server(
+        lambda reader, writer: _handle_connection(
+            reader=reader, writer=writer, log_queue=log_queue
+        ),
+        host=host,
+        port=port,
+        reuse_address=True,
+        limit=HEAD_LIMIT
+    )
+    async with server:
+        await server.serve_forever()
+
+
+def run_server(log_queue, host="0.0.0.0", port=8080):
+    """
+    Runs raw HTTP listener and sends printed data to the
+    parent via queue. Connections are served concurrently by asyncio.
+
+    `log_queue` is any object with `put` method that takes the packed time
+    and raw bytes of the request, `capacity` - the maximum size of the
+    record, and `connections` counter of the open connections, for example
+    `RingBuffer`.
+    """
+    asyncio.run(_serve(log_queue=log_queue, host=host, port=port))
 
 
 class HttpKernel(IPythonKernel):
+    grace_period = Float(
+        0.0,
+        help=(
+            "Maximum seconds to wait for the in-flight requests after the "
+            "cell is executed, waiting stops once all connections are closed."
+        )
+    ).tag(config=True)
+    max_requests = Int(
+        1000,
+        help=(
+            "Maximum number of the requests printed after the cell, the rest "
+            "of the requests are dropped."
+        )
+    ).tag(config=True)
+    buffer_size = Int(
+        64 * 2 ** 20,
+        help=(
+            "Size in bytes of the shared memory buffer for the captured "
+            "requests. Requests that don't fit are dropped."
+        )
+    ).tag(config=True)
+    store_max_requests = Int(
+        100000,
+        help="Maximum number of requests kept in the capture store."
+    ).tag(config=True)
+    store_max_bytes = Int(
+        2 ** 28,
+        help="Maximum total size of requests kept in the capture store."
+    ).tag(config=True)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.log_queue = mp.Queue()
+        self.capture_stats = {
+            "received": 0, "dropped": 0, "drained": 0, "depth": 0
+        }
+        self.log_queue = RingBuffer(capacity=self.buffer_size)
+        self._buffer_dropped = 0
+        self.capture_store = CaptureStore(
+            max_requests=self.store_max_requests,
+            max_bytes=self.store_max_bytes
+        )
+        self.shell.user_ns["captured"] = self.capture_store.query
         self.proc = mp.Process(
             target=run_server,
             args=((self.log_queue, "0.0.0.0", 3232)),
@@ -79,14 +278,27 @@ class HttpKernel(IPythonKernel):
             allow_stdin=allow_stdin
         )
 
-        if not self.log_queue.empty():
-            msg = self.log_queue.get()
+        requests, dropped = await self._drain_requests()
+        if requests:
+            msg = "\n".join(requests)
             logger.debug("Got messages from server \n: %s", msg)
             self.send_response(
                 self.iopub_socket,
                 'stream',
                 {"name": "stdout", "text": msg}
             )
+        if dropped:
+            self.send_response(
+                self.iopub_socket,
+                'stream',
+                {
+                    "name": "stderr",
+                    "text": (
+                        f"Captured {len(requests) + dropped} requests, "
+                        f"{dropped} dropped.\n"
+                    )
+                }
+            )
 
         return {
             'status': 'ok',
@@ -95,8 +307,61 @@ class HttpKernel(IPythonKernel):
             'user_expressions': {},
         }
 
+    async def _drain_requests(self) -> tuple[list[str], int]:
+        """
+        Takes all requests that have arrived during the cell, waiting up to
+        `grace_period` seconds for the in-flight ones while the server has
+        open connections. Requests are parsed to the capture store, only
+        requests to be printed are decoded as a whole.
+
+        Returns
+        -------
+        tuple[list[str], int]
+            - Requests to be printed, not more than `max_requests`.
+            - Number of dropped requests.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.grace_period
+        requests: list[str] = []
+        dropped = 0
+        # Bytes waiting in the buffer when the drain starts.
+        depth = len(self.log_queue)
+
+        while True:
+            # Requests of the closed connections are already in the buffer.
+            idle = self.log_queue.connections == 0
+            for record in self.log_queue.records():
+                (received,) = TIMESTAMP.unpack_from(record)
+                with record[TIMESTAMP.size:] as raw:
+                    self.capture_store.add(
+                        CapturedRequest.parse(raw=raw, time=received)
+                    )
+                    if len(requests) < self.max_requests:
+                        requests.append(str(raw, "latin1"))
+                    else:
+                        dropped += 1
+            if idle or loop.time() >= deadline:
+                break
+            await asyncio.sleep(0.01)
+
+        # Requests that didn't fit into the buffer.
+        lost = self.log_queue.dropped - self._buffer_dropped
+        self._buffer_dropped += lost
+        drained = len(requests) + dropped
+        dropped += lost
+        self.capture_stats["received"] += drained + lost
+        self.capture_stats["dropped"] += dropped
+        self.capture_stats["drained"] = drained
+        self.capture_stats["depth"] = depth
+        logger.debug(
+            "Drained %s requests, %s dropped, queue depth %s bytes.",
+            drained, dropped, depth
+        )
+        return requests, dropped
+
     def do_shutdown(self, restart):
         logging.info("Shutting kernel down.")
         self.proc.terminate()
         self.proc.join()
+        self.log_queue.close()
         return super().do_shutdown(restart)
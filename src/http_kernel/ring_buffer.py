@@ -0,0 +1,167 @@
+"""
+Ring buffer in the shared memory for passing captured requests from the
+server process to the kernel without pickling and copying them through the
+pipe.
+
+There must be only one writing process and one reading process. Records are
+stored as 4-byte length prefix followed by the raw bytes, each record is kept
+contiguous, so the reader can access it as a `memoryview`.
+"""
+import struct
+from typing import Iterator
+from multiprocessing.shared_memory import SharedMemory
+
+# Header: total written bytes, total read bytes, number of dropped records,
+# number of connections open in the writing process.
+_HEADER = 4 * 8
+_PREFIX = struct.Struct("<I")
+# Length prefix that marks the end of the buffer is skipped.
+_SKIP = 0xFFFFFFFF
+
+
+class RingBuffer:
+    """
+    Single producer single consumer ring buffer of the byte records in
+    `multiprocessing.shared_memory`.
+
+    Can be passed to the child process: it attaches to the same shared memory
+    block.
+
+    Parameters
+    ----------
+    capacity: int
+        Size of the data area in bytes.
+    name: str | None
+        Name of the existing shared memory block to attach to. New block is
+        created if not specified.
+    """
+
+    def __init__(self, capacity: int, name: str | None = None):
+        if capacity < _PREFIX.size:
+            raise ValueError("Capacity is too small.")
+        self.capacity = capacity
+        self._owner = name is None
+        self._shm = SharedMemory(
+            name=name,
+            create=self._owner,
+            size=_HEADER + capacity
+        )
+        self._header = self._shm.buf[:_HEADER].cast("Q")
+        self._data = self._shm.buf[_HEADER:_HEADER + capacity]
+        if self._owner:
+            for i in range(len(self._header)):
+                self._header[i] = 0
+
+    def __reduce__(self):
+        return self.__class__, (self.capacity, self._shm.name)
+
+    @property
+    def dropped(self) -> int:
+        """
+        Number of records that didn't fit into the buffer.
+        """
+        return self._header[2]
+
+    @property
+    def connections(self) -> int:
+        """
+        Number of the connections the writing process is serving, set by
+        the writer so the reader knows whether more records can come.
+        """
+        return self._header[3]
+
+    @connections.setter
+    def connections(self, value: int) -> None:
+        self._header[3] = value
+
+    def __len__(self) -> int:
+        """
+        Number of bytes waiting for the reader.
+        """
+        return self._header[0] - self._header[1]
+
+    def put(self, *parts: bytes | bytearray | memoryview) -> bool:
+        """
+        Write record to the buffer. Record is dropped if there is not enough
+        free space.
+
+        Parameters
+        ----------
+        *parts: bytes | bytearray | memoryview
+            Parts of the record, they are written one after another.
+
+        Returns
+        -------
+        bool
+            Whether the record was written.
+        """
+        length = sum(len(part) for part in parts)
+        size = _PREFIX.size + length
+        write, read = self._header[0], self._header[1]
+        offset = write % self.capacity
+        tail = self.capacity - offset
+        skip = tail if tail < size else 0
+
+        if write + skip + size - read > self.capacity:
+            self._header[2] += 1
+            return False
+
+        if skip:
+            if tail >= _PREFIX.size:
+                _PREFIX.pack_into(self._data, offset, _SKIP)
+            write += skip
+            offset = 0
+
+        _PREFIX.pack_into(self._data, offset, length)
+        start = offset + _PREFIX.size
+        for part in parts:
+            self._data[start:start + len(part)] = part
+            start += len(part)
+        # Record becomes visible for the reader only after it is written.
+        self._header[0] = write + size
+        return True
+
+    def records(self) -> Iterator[memoryview]:
+        """
+        Read all available records. The space of the record is released when
+        the next record is requested, so the view must not be used after
+        that.
+
+        Returns
+        -------
+        Iterator[memoryview]
+            Views of the records in the shared memory.
+        """
+        while True:
+            read, write = self._header[1], self._header[0]
+            if read == write:
+                return
+
+            offset = read % self.capacity
+            tail = self.capacity - offset
+            if tail < _PREFIX.size:
+                self._header[1] = read + tail
+                continue
+            (size,) = _PREFIX.unpack_from(self._data, offset)
+            if size == _SKIP:
+                self._header[1] = read + tail
+                continue
+
+            start = offset + _PREFIX.size
+            view = self._data[start:start + size]
+            try:
+                yield view
+            finally:
+                view.release()
+                self._header[1] = read + _PREFIX.size + size
+
+    def close(self) -> None:
+        """
+        Detach from the shared memory, the block is removed by the process
+        that has created it.
+        """
+        self._header.release()
+        self._data.release()
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
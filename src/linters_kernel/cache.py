@@ -0,0 +1,152 @@
+"""
+Cache of the linters output on the disk. It is kept between the kernel
+restarts, so unchanged cells are not checked again.
+"""
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, NamedTuple
+
+
+def default_directory() -> Path:
+    """
+    Directory of the cache in the user cache directory.
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "linters_kernel"
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    maxsize: int
+    currsize: int
+
+
+class LintCache:
+    """
+    Outputs of the linters on the disk, identified by the hash of the tool,
+    its version, its configuration and the checked code. When the total size
+    exceeds the limit, the least recently used outputs are evicted.
+
+    Parameters
+    ----------
+    directory: Path | str | None
+        Directory of the cache, `default_directory()` if not specified.
+    maxsize: int
+        Maximum total size of the outputs in bytes.
+    """
+
+    def __init__(
+        self,
+        directory: Path | str | None = None,
+        maxsize: int = 2 ** 26
+    ):
+        self.directory = Path(directory or default_directory())
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._sizes = {
+            path.name: path.stat().st_size
+            for path in self.directory.iterdir()
+            if path.is_file() and not path.name.startswith(".")
+        }
+        self._size = sum(self._sizes.values())
+
+    @staticmethod
+    def key(tool: str, version: str, config: Any, code: str) -> str:
+        """
+        Key of the output.
+
+        Parameters
+        ----------
+        tool: str
+            Name of the linter.
+        version: str
+            Version of the linter.
+        config: Any
+            JSON serializable configuration of the linter.
+        code: str
+            Checked code.
+
+        Returns
+        -------
+        str
+            Hex digest that identifies the output.
+        """
+        dump = json.dumps([tool, version, config, code], sort_keys=True)
+        return hashlib.sha256(dump.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """
+        Output stored by the key, None if there is no such output.
+        """
+        path = self.directory / key
+        try:
+            output = path.read_text(encoding="utf-8")
+            # Modification time is the time of the last use.
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+                self._forget(key)
+            return None
+        with self._lock:
+            self.hits += 1
+        return output
+
+    def put(self, key: str, output: str) -> None:
+        """
+        Store the output by the key.
+        """
+        data = output.encode("utf-8")
+        # Other kernels may read the same directory, so the output is
+        # written to the temporary file and then moved in one step.
+        fd, temp = tempfile.mkstemp(dir=self.directory, prefix=".")
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(temp, self.directory / key)
+
+        with self._lock:
+            self._forget(key)
+            self._sizes[key] = len(data)
+            self._size += len(data)
+            if self._size > self.maxsize:
+                self._evict()
+
+    def _forget(self, key: str) -> None:
+        self._size -= self._sizes.pop(key, 0)
+
+    def _evict(self) -> None:
+        def last_use(key: str) -> float:
+            try:
+                return (self.directory / key).stat().st_mtime
+            except FileNotFoundError:
+                return float("-inf")
+
+        for key in sorted(self._sizes, key=last_use):
+            if self._size <= self.maxsize:
+                break
+            (self.directory / key).unlink(missing_ok=True)
+            self._forget(key)
+            self.evictions += 1
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(
+            self.hits, self.misses, self.evictions, self.maxsize, self._size
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in self._sizes:
+                (self.directory / key).unlink(missing_ok=True)
+            self._sizes.clear()
+            self._size = 0
+            self.hits = self.misses = self.evictions = 0
@@ -0,0 +1,305 @@
+"""
+Long-lived type checkers for the linters kernel. Checkers keep the analysis
+of typeshed and the standard library between the cells, so repeated checks
+are incremental.
+
+- mypy runs as `dmypy` daemon, it is started by the first call of its client.
+- pyright runs as language server, the kernel talks to it through the
+  language server protocol over stdin/stdout.
+"""
+import json
+import queue
+import shutil
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from typing import Any, BinaryIO, Iterable
+
+# Severity of the LSP diagnostic by its code.
+_SEVERITY = {1: "error", 2: "warning", 3: "information", 4: "hint"}
+
+
+class Workspace:
+    """
+    Directory owned by the kernel: the code of the cells and the state of the
+    checkers are kept there. The directory is removed by `cleanup`.
+
+    Parameters
+    ----------
+    prefix: str
+        Prefix of the name of the temporary directory.
+    """
+
+    def __init__(self, prefix: str = "linters_kernel_"):
+        self.path = Path(tempfile.mkdtemp(prefix=prefix))
+
+    def write(self, code: str, name: str = "cell.py") -> Path:
+        """
+        Write code to the file of the workspace.
+
+        Parameters
+        ----------
+        code: str
+            Code to be written.
+        name: str
+            Name of the file. The same name is used for all cells, so the
+            checkers see each new cell as the change of the same module.
+
+        Returns
+        -------
+        Path
+            Path to the file.
+        """
+        path = self.path / name
+        path.write_text(code, encoding="utf-8")
+        return path
+
+    def cleanup(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class Dmypy:
+    """
+    Commands for the `dmypy` daemon that belongs to the workspace. The daemon
+    is started by the first check.
+
+    Parameters
+    ----------
+    workspace: Workspace
+        Workspace where the status file and the cache of the daemon are kept.
+    args: Iterable[str]
+        Additional arguments for mypy.
+    """
+
+    def __init__(self, workspace: Workspace, args: Iterable[str] = ()):
+        self.status_file = workspace.path / ".dmypy.json"
+        self.args = [
+            "--cache-dir", str(workspace.path / ".mypy_cache"), *args
+        ]
+
+    def command(self, path: Path) -> list[str]:
+        """
+        Command that checks the file with the daemon.
+        """
+        return [
+            "dmypy", "--status-file", str(self.status_file),
+            "run", "--", *self.args, str(path)
+        ]
+
+    def stop(self) -> None:
+        if self.status_file.exists():
+            subprocess.run(
+                ["dmypy", "--status-file", str(self.status_file), "stop"],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+
+
+def _write_message(stream: BinaryIO, message: dict[str, Any]) -> None:
+    body = json.dumps(message).encode("utf-8")
+    stream.write(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+    stream.flush()
+
+
+def _read_message(stream: BinaryIO) -> dict[str, Any] | None:
+    length = None
+    while True:
+        line = stream.readline()
+        if not line:
+            return None
+        line = line.strip()
+        if not line:
+            break
+        name, _, value = line.decode("ascii").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    if length is None:
+        return None
+    return json.loads(stream.read(length))
+
+
+class PyrightServer:
+    """
+    Client of the `pyright-langserver` running in the background.
+
+    Parameters
+    ----------
+    root: Path
+        Root directory of the analysed project.
+    command: Iterable[str]
+        Command that starts the language server in the stdio mode.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        command: Iterable[str] = ("pyright-langserver", "--stdio")
+    ):
+        self._process = subprocess.Popen(
+            list(command),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        self._write_lock = threading.Lock()
+        self._next_id = 0
+        self._responses: dict[int, queue.Queue] = {}
+        self._diagnostics: queue.Queue = queue.Queue()
+        self._versions: dict[str, int] = {}
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+        self._request("initialize", {
+            "processId": None,
+            "rootUri": root.as_uri(),
+            "workspaceFolders": [{"uri": root.as_uri(), "name": root.name}],
+            "capabilities": {
+                "textDocument": {"publishDiagnostics": {
+                    "versionSupport": True
+                }}
+            }
+        })
+        self._send({"method": "initialized", "params": {}})
+
+    def _send(self, message: dict[str, Any]) -> None:
+        with self._write_lock:
+            _write_message(self._process.stdin, {"jsonrpc": "2.0", **message})
+
+    def _request(
+        self,
+        method: str,
+        params: dict[str, Any],
+        timeout: float = 60
+    ) -> Any:
+        with self._write_lock:
+            self._next_id += 1
+            request_id = self._next_id
+        response = self._responses[request_id] = queue.Queue()
+        self._send({"id": request_id, "method": method, "params": params})
+        try:
+            return response.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No response to {method} from pyright.")
+        finally:
+            del self._responses[request_id]
+
+    def _read(self) -> None:
+        """
+        Dispatches the messages of the server until it exits.
+        """
+        while (message := _read_message(self._process.stdout)) is not None:
+            method = message.get("method")
+            if method is None:
+                response = self._responses.get(message.get("id"))
+                if response is not None:
+                    response.put(message.get("result"))
+            elif "id" in message:
+                # Requests of the server, defaults are suitable for all of
+                # them.
+                result = None
+                if method == "workspace/configuration":
+                    result = [None] * len(message["params"]["items"])
+                self._send({"id": message["id"], "result": result})
+            elif method == "textDocument/publishDiagnostics":
+                self._diagnostics.put(message["params"])
+
+    def check(
+        self,
+        path: Path,
+        code: str,
+        timeout: float = 60
+    ) -> list[dict[str, Any]]:
+        """
+        Diagnostics of the code of the file. The file is opened in the server
+        on the first check, next checks send only the change of its content.
+
+        Parameters
+        ----------
+        path: Path
+            Path to the file.
+        code: str
+            Current content of the file.
+        timeout: float
+            Maximum time to wait for the diagnostics in seconds.
+
+        Returns
+        -------
+        list[dict[str, Any]]
+            Diagnostics in the format of the language server protocol.
+        """
+        uri = path.as_uri()
+        version = self._versions.get(uri, 0) + 1
+        self._versions[uri] = version
+        if version == 1:
+            self._send({
+                "method": "textDocument/didOpen",
+                "params": {"textDocument": {
+                    "uri": uri,
+                    "languageId": "python",
+                    "version": version,
+                    "text": code
+                }}
+            })
+        else:
+            self._send({
+                "method": "textDocument/didChange",
+                "params": {
+                    "textDocument": {"uri": uri, "version": version},
+                    "contentChanges": [{"text": code}]
+                }
+            })
+
+        while True:
+            try:
+                params = self._diagnostics.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError("No diagnostics from pyright.")
+            if params["uri"] == uri and params.get("version") == version:
+                return params["diagnostics"]
+
+    def close(self) -> None:
+        if self._process.poll() is not None:
+            return
+        try:
+            self._request("shutdown", {}, timeout=5)
+            self._send({"method": "exit", "params": {}})
+            self._process.wait(timeout=5)
+        except (OSError, TimeoutError, subprocess.TimeoutExpired):
+            self._process.kill()
+
+
+def format_diagnostics(path: Path, diagnostics: list[dict[str, Any]]) -> str:
+    """
+    Report in the format of the pyright command line interface.
+
+    Parameters
+    ----------
+    path: Path
+        Path to the checked file.
+    diagnostics: list[dict[str, Any]]
+        Diagnostics in the format of the language server protocol.
+
+    Returns
+    -------
+    str
+        Lines of the report.
+    """
+    counts = dict.fromkeys(("error", "warning", "information"), 0)
+    lines = []
+    for diagnostic in diagnostics:
+        start = diagnostic["range"]["start"]
+        severity = _SEVERITY.get(diagnostic.get("severity", 1), "error")
+        if severity in counts:
+            counts[severity] += 1
+        rule = diagnostic.get("code")
+        lines.append(
+            f"{path}:{start['line'] + 1}:{start['character'] + 1} - "
+            f"{severity}: {diagnostic['message']}"
+            + (f" ({rule})" if rule else "")
+        )
+    lines.append(
+        f"{counts['error']} errors, {counts['warning']} warnings, "
+        f"{counts['information']} informations"
+    )
+    return "\n".join(lines) + "\n"
@@ -1,7 +1,11 @@
-import os
-from tempfile import mkstemp
+import shlex
+from traitlets import Enum, Int
 from command_kernel import CommandKernel, command
 
+from src.linters_kernel.cache import LintCache
+from src.linters_kernel.daemons import Workspace
+from src.linters_kernel.runner import TOOLS, LintRunner, format_report
+
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,32 +14,117 @@ logger = logging.getLogger(__name__)
 class LintersKernel(CommandKernel):
     """
     Kernel that apples a linter to the given code.
+
+    The cells are written to the workspace directory of the kernel, which is
+    removed on shutdown. Type checkers are kept running between the cells:
+    mypy as `dmypy` daemon and pyright as language server. Outputs of the
+    linters are cached on the disk, so unchanged cells are not checked again.
     """
     command_symbol = "#"
+    cache_maxsize = Int(
+        2 ** 26,
+        help="Maximum size in bytes of the cache of the linters outputs."
+    ).tag(config=True)
+    mypy_mode = Enum(
+        ["daemon", "api"],
+        default_value="daemon",
+        help=(
+            "How mypy is run: \"daemon\" - as `dmypy`, \"api\" - in the "
+            "worker process with the persistent cache, the output is "
+            "streamed."
+        )
+    ).tag(config=True)
 
-    def _temp_file(self, code: str) -> str:
-        """
-        Create a tempfile that stores the code to be linted.
+    _workspace: Workspace | None = None
+    _runner: LintRunner | None = None
+
+    @property
+    def workspace(self) -> Workspace:
+        if self._workspace is None:
+            self._workspace = Workspace()
+        return self._workspace
 
-        Returns
-        -------
-        Path to the file.
+    @property
+    def runner(self) -> LintRunner:
+        if self._runner is None:
+            self._runner = LintRunner(
+                self.workspace,
+                LintCache(maxsize=self.cache_maxsize),
+                mypy_mode=self.mypy_mode
+            )
+        return self._runner
+
+    def _print(self, text: str, name: str = "stdout") -> str:
+        """
+        Send the text to the output of the cell. Returns the command that
+        does nothing, so the text is the whole output of the cell.
         """
-        fd, path = mkstemp()
-        os.write(fd, code.encode("utf-8"))
-        os.close(fd)
-        return path
+        if text:
+            self.send_response(
+                self.iopub_socket, "stream", {"name": name, "text": text}
+            )
+        return "true"
 
     def no_commands(self, code: str) -> str:
         logger.info("no commands is invoked")
-        return f"python3 {self._temp_file(code)}"
+        path = self.workspace.write(code, name="main.py")
+        return f"python3 {shlex.quote(str(path))}"
+
+    def _stream(self, tool: str, text: str) -> None:
+        self._print(text)
 
     @command("mypy")
     def mypy(self, code: str) -> str:
         logger.info("mypy is invoked")
-        return f"mypy {self._temp_file(code)}"
+        if self.mypy_mode == "api":
+            # Output is sent to the cell while mypy writes it.
+            self.runner.check(["mypy"], code, on_output=self._stream)
+            return "true"
+        return self._print(self.runner.check(["mypy"], code)[0].output)
 
     @command("pyright")
     def pyright(self, code: str) -> str:
         logger.info("pyright is invoked")
-        return f"pyright {self._temp_file(code)}"
+        return self._print(self.runner.check(["pyright"], code)[0].output)
+
+    @command("ruff")
+    def ruff(self, code: str) -> str:
+        logger.info("ruff is invoked")
+        return self._print(self.runner.check(["ruff"], code)[0].output)
+
+    @command("lint")
+    def lint(self, code: str, *tools: str) -> str:
+        """
+        Check the code with several linters at the same time, all of the
+        supported linters are used if they are not specified.
+        """
+        logger.info("lint is invoked")
+        unknown = [tool for tool in tools if tool not in TOOLS]
+        if unknown:
+            self._print(
+                f"Unknown linters: {', '.join(unknown)}. "
+                f"Supported linters: {', '.join(TOOLS)}.\n",
+                name="stderr"
+            )
+            return "false"
+        return self._print(
+            format_report(self.runner.check(tools or TOOLS, code))
+        )
+
+    @command("lint_cache")
+    def lint_cache(self, code: str) -> str:
+        """
+        Print the statistics of the cache, the cache is cleared if the cell
+        contains "clear".
+        """
+        cache = self.runner.cache
+        if code.strip() == "clear":
+            cache.clear()
+        return self._print(f"{cache.info()}\n")
+
+    def do_shutdown(self, restart):
+        if self._runner is not None:
+            self._runner.close()
+        if self._workspace is not None:
+            self._workspace.cleanup()
+        return super().do_shutdown(restart)
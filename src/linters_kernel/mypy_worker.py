@@ -0,0 +1,216 @@
+"""
+mypy in a long-lived worker process. The worker imports mypy once and keeps
+its incremental cache in a persistent directory, so each check pays neither
+the start of the interpreter nor the analysis of the unchanged modules.
+"""
+import io
+import os
+import time
+import tempfile
+import threading
+import traceback
+import subprocess
+import multiprocessing
+from pathlib import Path
+from typing import Iterable, Iterator
+from multiprocessing.connection import Connection
+
+from src.linters_kernel.cache import default_directory
+
+
+class _Stream(io.TextIOBase):
+    """
+    Text stream that sends everything written to the connection, tagged
+    with the id of the current request.
+    """
+
+    def __init__(self, connection: Connection):
+        self.connection = connection
+        self.request_id = 0
+
+    def write(self, text: str) -> int:
+        if text:
+            self.connection.send((self.request_id, "output", text))
+        return len(text)
+
+
+def _serve(connection: Connection) -> None:
+    """
+    Loop of the worker: receives the id of the request, the working
+    directory and the arguments of mypy, sends the output as it is written
+    and then the exit status.
+    """
+    from mypy.main import main
+
+    stream = _Stream(connection)
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        stream.request_id, cwd, args = request
+        try:
+            os.chdir(cwd)
+            # `mypy.api.run` collects the output into the string, here the
+            # same entry point writes it directly to the connection.
+            main(args=args, stdout=stream, stderr=stream, clean_exit=True)
+            status = 0
+        except SystemExit as system_exit:
+            code = system_exit.code
+            status = code if isinstance(code, int) else 2
+        except Exception:
+            stream.write(traceback.format_exc())
+            status = 2
+        connection.send((stream.request_id, "exit", status))
+
+
+class MypyWorker:
+    """
+    Process that runs mypy checks one after another.
+
+    Parameters
+    ----------
+    cache_dir: Path | str | None
+        Incremental cache of mypy, "mypy" in the `default_directory()` of the
+        linters cache if not specified.
+    sqlite_cache: bool
+        Keep the cache in the SQLite database instead of the JSON files.
+    start_method: str
+        Start method of the worker process.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path | str | None = None,
+        sqlite_cache: bool = False,
+        start_method: str = "spawn"
+    ):
+        self.cache_dir = Path(cache_dir or default_directory() / "mypy")
+        self.args = ["--cache-dir", str(self.cache_dir)]
+        if sqlite_cache:
+            self.args.append("--sqlite-cache")
+        self.exit_status: int | None = None
+
+        context = multiprocessing.get_context(start_method)
+        self._connection, child = context.Pipe()
+        self._process = context.Process(
+            target=_serve, args=(child,), daemon=True
+        )
+        self._process.start()
+        child.close()
+        self._lock = threading.Lock()
+        self._request_id = 0
+
+    def run(
+        self,
+        args: Iterable[str],
+        cwd: Path | str | None = None
+    ) -> Iterator[str]:
+        """
+        Run mypy with the arguments. The exit status of mypy is available
+        as `exit_status` when the output is exhausted. If the output is
+        abandoned, its rest is skipped by the next run.
+
+        Parameters
+        ----------
+        args: Iterable[str]
+            Command line arguments of mypy.
+        cwd: Path | str | None
+            Working directory of the check, the current one if not
+            specified.
+
+        Returns
+        -------
+        Iterator[str]
+            Parts of the output as they are written by mypy.
+        """
+        with self._lock:
+            self._request_id += 1
+            request_id = self._request_id
+            self.exit_status = None
+            self._connection.send(
+                (request_id, str(cwd or os.getcwd()), [*self.args, *args])
+            )
+            while True:
+                response_id, kind, value = self._connection.recv()
+                if response_id != request_id:
+                    # Rest of the output of the abandoned run.
+                    continue
+                if kind == "exit":
+                    self.exit_status = value
+                    return
+                yield value
+
+    def close(self) -> None:
+        if self._process.is_alive():
+            try:
+                self._connection.send(None)
+            except OSError:
+                pass
+            self._process.join(5)
+            if self._process.is_alive():
+                self._process.kill()
+        self._connection.close()
+
+
+def benchmark_mypy(
+    repeat: int = 3,
+    sqlite_cache: bool = False
+) -> dict[str, list[float]]:
+    '''
+    Measures time of checking the small module that imports a few modules of
+    the standard library:
+    - "cli": new `mypy` process with the empty cache.
+    - "cold": first check of the `MypyWorker` with the empty cache.
+    - "warm": next checks of the same worker after the code has changed.
+
+    Parameters
+    ----------
+    repeat: int
+        Number of measurements for each way.
+    sqlite_cache: bool
+        Use the SQLite cache in the worker.
+
+    Returns
+    -------
+    dict[str, list[float]]
+        Measured times in seconds.
+    '''
+    code = "import os\nimport json\nimport asyncio\nx: int = {}\n"
+    ans: dict[str, list[float]] = {"cli": [], "cold": [], "warm": []}
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "cell.py"
+            path.write_text(code.format(0))
+            begin = time.perf_counter()
+            subprocess.run(
+                ["mypy", "--cache-dir", str(Path(tmpdir) / "cli"), str(path)],
+                stdout=subprocess.DEVNULL
+            )
+            ans["cli"].append(time.perf_counter() - begin)
+
+            worker = MypyWorker(
+                cache_dir=Path(tmpdir) / "worker",
+                sqlite_cache=sqlite_cache
+            )
+            try:
+                for value in range(2):
+                    path.write_text(code.format(value))
+                    begin = time.perf_counter()
+                    "".join(worker.run([str(path)]))
+                    ans["warm" if value else "cold"].append(
+                        time.perf_counter() - begin
+                    )
+            finally:
+                worker.close()
+    return ans
+
+
+if __name__ == "__main__":
+    for way, times in benchmark_mypy().items():
+        print(
+            f"{way}: {min(times):.3f} s min, "
+            f"{sum(times) / len(times):.3f} s mean"
+        )
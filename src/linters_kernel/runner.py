@@ -0,0 +1,226 @@
+"""
+Running of the linters for the code of the cell: several linters check the
+same file of the workspace at the same time, their outputs are cached.
+"""
+import time
+import threading
+import subprocess
+from pathlib import Path
+from typing import Callable, Iterable, NamedTuple
+from concurrent.futures import ThreadPoolExecutor
+from importlib.metadata import PackageNotFoundError, version
+
+from src.linters_kernel.cache import LintCache
+from src.linters_kernel.mypy_worker import MypyWorker
+from src.linters_kernel.daemons import (
+    Dmypy,
+    Workspace,
+    PyrightServer,
+    format_diagnostics
+)
+
+TOOLS = ("mypy", "pyright", "ruff")
+RUFF_ARGS = ("check", "--no-cache", "--output-format", "concise")
+
+
+class LintResult(NamedTuple):
+    tool: str
+    output: str
+    time: float
+    cached: bool
+
+
+class LintRunner:
+    """
+    Linters of the kernel. mypy and pyright are kept running in the
+    background, see `src.linters_kernel.daemons` and
+    `src.linters_kernel.mypy_worker`.
+
+    Parameters
+    ----------
+    workspace: Workspace
+        Workspace where the checked code is written.
+    cache: LintCache | None
+        Cache of the outputs, outputs are not cached if not specified.
+    mypy_args: Iterable[str]
+        Additional arguments for mypy.
+    mypy_mode: str
+        How mypy is run:
+        - "daemon": `dmypy` daemon with the cache in the workspace.
+        - "api": `MypyWorker` process with the persistent cache.
+    """
+
+    def __init__(
+        self,
+        workspace: Workspace,
+        cache: LintCache | None = None,
+        mypy_args: Iterable[str] = (),
+        mypy_mode: str = "daemon"
+    ):
+        if mypy_mode not in ("daemon", "api"):
+            raise ValueError(f"Unknown mypy mode: {mypy_mode}")
+        self.workspace = workspace
+        self.cache = cache
+        self.mypy_args = list(mypy_args)
+        self.mypy_mode = mypy_mode
+        self._dmypy = Dmypy(workspace, self.mypy_args)
+        self._mypy_worker: MypyWorker | None = None
+        self._pyright: PyrightServer | None = None
+        self._pyright_lock = threading.Lock()
+        self._versions: dict[str, str] = {}
+
+    def version(self, tool: str) -> str:
+        """
+        Version of the installed linter.
+        """
+        if tool not in self._versions:
+            try:
+                self._versions[tool] = version(tool)
+            except PackageNotFoundError:
+                self._versions[tool] = subprocess.run(
+                    [tool, "--version"], capture_output=True, text=True
+                ).stdout.strip()
+        return self._versions[tool]
+
+    def _config(self, tool: str) -> list[str]:
+        return {
+            "mypy": self.mypy_args,
+            "pyright": [],
+            "ruff": list(RUFF_ARGS)
+        }[tool]
+
+    def _run(
+        self,
+        tool: str,
+        path: Path,
+        code: str,
+        on_output: Callable[[str], None]
+    ) -> str:
+        """
+        Output of the linter for the file. The linters are started in the
+        workspace with the relative path, so the output doesn't depend on the
+        location of the workspace.
+        """
+        relative = Path(path.name)
+        if tool == "pyright":
+            with self._pyright_lock:
+                if self._pyright is None:
+                    self._pyright = PyrightServer(self.workspace.path)
+            output = format_diagnostics(
+                relative, self._pyright.check(path, code)
+            )
+            on_output(output)
+            return output
+
+        if tool == "mypy" and self.mypy_mode == "api":
+            if self._mypy_worker is None:
+                self._mypy_worker = MypyWorker()
+            parts = []
+            for part in self._mypy_worker.run(
+                [*self.mypy_args, str(relative)], cwd=self.workspace.path
+            ):
+                on_output(part)
+                parts.append(part)
+            return "".join(parts)
+
+        if tool == "mypy":
+            command = self._dmypy.command(relative)
+        else:
+            command = ["ruff", *RUFF_ARGS, str(relative)]
+        output = subprocess.run(
+            command,
+            cwd=self.workspace.path,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True
+        ).stdout
+        # Message of the first dmypy call, it's not a part of the check.
+        output = output.removeprefix("Daemon started\n")
+        on_output(output)
+        return output
+
+    def _check(
+        self,
+        tool: str,
+        path: Path,
+        code: str,
+        on_output: Callable[[str, str], None] | None = None
+    ) -> LintResult:
+        def send(text: str) -> None:
+            if on_output is not None:
+                on_output(tool, text)
+
+        start = time.perf_counter()
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(
+                tool, self.version(tool), self._config(tool), code
+            )
+            output = self.cache.get(key)
+            if output is not None:
+                send(output)
+                return LintResult(
+                    tool, output, time.perf_counter() - start, True
+                )
+
+        output = self._run(tool, path, code, send)
+        if key is not None:
+            self.cache.put(key, output)
+        return LintResult(tool, output, time.perf_counter() - start, False)
+
+    def check(
+        self,
+        tools: Iterable[str],
+        code: str,
+        on_output: Callable[[str, str], None] | None = None
+    ) -> list[LintResult]:
+        """
+        Check the code with the given linters. The code is written to the
+        workspace once and linters are run at the same time.
+
+        Parameters
+        ----------
+        tools: Iterable[str]
+            Names of the linters, some of the `TOOLS`.
+        code: str
+            Code to be checked.
+        on_output: Callable[[str, str], None] | None
+            Called with the name of the linter and the part of its output as
+            soon as it is available. mypy in the "api" mode reports the
+            output in parts, the other linters report the whole output.
+
+        Returns
+        -------
+        list[LintResult]
+            Outputs of the linters in the given order.
+        """
+        tools = list(tools)
+        unknown = set(tools) - set(TOOLS)
+        if unknown:
+            raise ValueError(f"Unknown linters: {unknown}")
+
+        path = self.workspace.write(code)
+        if len(tools) == 1:
+            return [self._check(tools[0], path, code, on_output)]
+        with ThreadPoolExecutor(max_workers=len(tools)) as executor:
+            return list(executor.map(
+                lambda tool: self._check(tool, path, code, on_output), tools
+            ))
+
+    def close(self) -> None:
+        self._dmypy.stop()
+        if self._mypy_worker is not None:
+            self._mypy_worker.close()
+        if self._pyright is not None:
+            self._pyright.close()
+
+
+def format_report(results: Iterable[LintResult]) -> str:
+    """
+    Outputs of several linters as one report with the time of each linter.
+    """
+    parts = []
+    for result in results:
+        source = "cached" if result.cached else f"{result.time:.2f} s"
+        parts.append(f"==== {result.tool} ({source}) ====\n{result.output}")
+    return "\n".join(parts)
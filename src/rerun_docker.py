@@ -1,11 +1,66 @@
+import json
 import time
+import socket
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from graphlib import TopologicalSorter
+from typing import Any, Callable, NamedTuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
 import docker
+from docker import DockerClient
+from docker.errors import NotFound
 from docker.models.containers import Container
 
-client = docker.from_env()
+# Client is created by `get_client` on the first use, so importing the module
+# doesn't require running docker daemon.
+client: DockerClient | None = None
+_client_lock = threading.Lock()
+
+# Seconds for which the result of the container existence check is reused.
+NAME_TTL = 2.0
+# Container name -> (exists, time of the check).
+_names: dict[str, tuple[bool, float]] = {}
+
+# Label with the hash of the configuration the container was created with.
+CONFIG_LABEL = "rerun_docker.config"
+
+
+def get_client() -> DockerClient:
+    '''
+    Docker client created from the environment on the first call.
+
+    Returns
+    -------
+    DockerClient
+        Client shared by the functions of the module.
+    '''
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                client = docker.from_env()
+    return client
 
 
-def check_container(name: str) -> bool:
+def clear_container_index(name: str | None = None) -> None:
+    '''
+    Forget the cached existence of the container, so that the next check
+    requests docker.
+
+    Parameters
+    ----------
+    name: str | None
+        Name of the container, all names are forgotten if not specified.
+    '''
+    if name is None:
+        _names.clear()
+    else:
+        _names.pop(name, None)
+
+
+def check_container(name: str, ttl: float = NAME_TTL) -> bool:
     '''
     Check if a container with the given name exists.
 
@@ -13,20 +68,39 @@ def check_container(name: str) -> bool:
     ----------
     name: str
         The name of the container to check.
+    ttl: float
+        The result of the previous check of the name is used if it is not
+        older than `ttl` seconds. The containers created and removed by this
+        module are tracked without requests to docker.
 
     Returns
     -------
     bool
         True if the container exists, False otherwise.
     '''
-    containters = [
-        container.name
-        for container in client.containers.list()
-    ]
-    return name in containters
+    cached = _names.get(name)
+    now = time.monotonic()
+    if cached is not None and now - cached[1] < ttl:
+        return cached[0]
+
+    # Name filter of the docker is a regular expression that matches the
+    # names with the leading "/". Sparse list doesn't inspect each container.
+    containters = get_client().containers.list(
+        filters={"name": f"^/{name}$"},
+        sparse=True
+    )
+    exists = any(
+        f"/{name}" in container.attrs.get("Names", ())
+        for container in containters
+    )
+    _names[name] = (exists, now)
+    return exists
 
 
-def ensure_container_remove(container: Container) -> None:
+def ensure_container_remove(
+    container: Container,
+    timeout: float = 60
+) -> None:
     """
     Remove given container and wait until it is removed.
 
@@ -34,16 +108,169 @@ def ensure_container_remove(container: Container) -> None:
     ----------
     container: Container
         The container to remove.
+    timeout: float
+        Maximum time in seconds to wait for the auto removal of the
+        container.
     """
     container.stop()
     if not container.attrs["HostConfig"]["AutoRemove"]:
+        # Removal is synchronous, container doesn't exist after the call.
         container.remove(force=True)
-    if container.name is not None:
-        while check_container(container.name):
-            time.sleep(1)
+    else:
+        try:
+            container.wait(condition="removed", timeout=timeout)
+        except NotFound:
+            # Container was removed before the wait request.
+            pass
+    _names[container.name] = (False, time.monotonic())
+
+
+def wait_port(container: Container, port: int, timeout: float = 60) -> None:
+    '''
+    Wait until the given port of the container accepts connections. The port
+    published on the host is used if there is one, otherwise the port is
+    reached by the address of the container.
+
+    Parameters
+    ----------
+    container: Container
+        The container to wait for.
+    port: int
+        Port inside the container.
+    timeout: float
+        Maximum time to wait in seconds.
+    '''
+    container.reload()
+    network = container.attrs["NetworkSettings"]
+    published = (network.get("Ports") or {}).get(f"{port}/tcp")
+    if published:
+        address = ("127.0.0.1", int(published[0]["HostPort"]))
+    else:
+        address = (network["IPAddress"], port)
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(address, timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise TimeoutError(
+                    f"Port {port} of {container.name} is closed."
+                )
+            time.sleep(0.1)
+
+
+def wait_log(container: Container, text: str, timeout: float = 60) -> None:
+    '''
+    Wait until the given text appears in the logs of the container.
+
+    Parameters
+    ----------
+    container: Container
+        The container to wait for.
+    text: str
+        Text to look for in the log lines.
+    timeout: float
+        Maximum time to wait in seconds.
+    '''
+    stream = container.logs(stream=True, follow=True)
+    timer = threading.Timer(timeout, stream.close)
+    timer.start()
+    # Chunks of the stream are not lines: a line can be split between the
+    # chunks, so the incomplete last line is kept until the rest arrives.
+    pending = b""
+    try:
+        for chunk in stream:
+            *lines, pending = (pending + chunk).split(b"\n")
+            for line in lines:
+                if text in line.decode("utf-8", errors="replace"):
+                    return
+        if text in pending.decode("utf-8", errors="replace"):
+            return
+    finally:
+        timer.cancel()
+        stream.close()
+    raise TimeoutError(f"{text!r} didn't appear in logs of {container.name}.")
+
+
+def wait_healthy(container: Container, timeout: float = 60) -> None:
+    '''
+    Wait until the healthcheck of the container reports "healthy" status.
+
+    Parameters
+    ----------
+    container: Container
+        The container to wait for.
+    timeout: float
+        Maximum time to wait in seconds.
+    '''
+    now = datetime.now()
+    events = get_client().events(
+        decode=True,
+        since=now,
+        until=now + timedelta(seconds=timeout),
+        filters={"container": container.id, "event": "health_status"}
+    )
+    try:
+        # Status may have changed before the events were requested.
+        container.reload()
+        health = container.attrs["State"].get("Health") or {}
+        if health.get("Status") == "healthy":
+            return
+        for event in events:
+            if event.get("status") == "health_status: healthy":
+                return
+    finally:
+        events.close()
+    raise TimeoutError(f"{container.name} didn't become healthy.")
 
 
-def reload_docker_container(name: str, **kwargs) -> Container:
+def config_hash(kwargs: dict[str, Any]) -> str:
+    '''
+    Hash of the keywords for the docker.client.containers.run() method.
+
+    Parameters
+    ----------
+    kwargs: dict[str, Any]
+        Keywords of the container. Values that are not JSON serializable are
+        represented by their `str`.
+
+    Returns
+    -------
+    str
+        Hex digest of the configuration.
+    '''
+    dump = json.dumps(kwargs, sort_keys=True, default=str)
+    return hashlib.sha256(dump.encode("utf-8")).hexdigest()
+
+
+def _with_config_label(kwargs: dict[str, Any], digest: str) -> dict[str, Any]:
+    labels = kwargs.get("labels") or {}
+    if isinstance(labels, list):
+        labels = dict.fromkeys(labels, "")
+    return {**kwargs, "labels": {**labels, CONFIG_LABEL: digest}}
+
+
+def _find_reusable(name: str, digest: str) -> Container | None:
+    if not check_container(name):
+        return None
+    container = get_client().containers.get(name)
+    if (
+        container.status == "running"
+        and container.labels.get(CONFIG_LABEL) == digest
+    ):
+        return container
+    return None
+
+
+def reload_docker_container(
+    name: str,
+    ready: Callable[[Container], None] | None = None,
+    reuse: bool = False,
+    restart: bool = False,
+    **kwargs
+) -> Container:
     '''
     Create container, in case it already created - remove it and create
     new one.
@@ -52,6 +279,16 @@ def reload_docker_container(name: str, **kwargs) -> Container:
     ----------
     name: str
         The name of the container to create or remove.
+    ready: Callable[[Container], None] | None
+        Readiness probe, called with the created container and returns when
+        the container is ready, for example
+        `lambda container: wait_port(container, 5432)`.
+    reuse: bool
+        Return the running container with the given name as it is, if it was
+        created by this function with the same `kwargs`. The hash of the
+        `kwargs` is kept in the "rerun_docker.config" label of the container.
+    restart: bool
+        Restart the reused container.
     kwargs: dict
         All other keywords for docker.client.containers.run() method.
 
@@ -60,12 +297,179 @@ def reload_docker_container(name: str, **kwargs) -> Container:
     Container
         The created container.
     '''
+    if reuse:
+        digest = config_hash(kwargs)
+        kwargs = _with_config_label(kwargs, digest)
+        container = _find_reusable(name, digest)
+        if container is not None:
+            return _resume_container(container, restart=restart, ready=ready)
+
+    _remove_container(name)
+    return _run_container(name=name, ready=ready, **kwargs)
+
+
+def _resume_container(
+    container: Container,
+    restart: bool = False,
+    ready: Callable[[Container], None] | None = None
+) -> Container:
+    if restart:
+        container.restart()
+    if ready is not None:
+        ready(container)
+    return container
+
 
+def _remove_container(name: str) -> None:
     if check_container(name):
-        container = client.containers.get(name)
+        container = get_client().containers.get(name)
         ensure_container_remove(container)
 
-    return client.containers.run(
+
+def _run_container(
+    name: str,
+    ready: Callable[[Container], None] | None = None,
+    **kwargs
+) -> Container:
+    container = get_client().containers.run(
         name=name,
         **kwargs
     )
+    _names[name] = (True, time.monotonic())
+    if ready is not None:
+        ready(container)
+    return container
+
+
+# Keywords of the specs of `reload_docker_containers` that are not passed to
+# the docker.client.containers.run() method.
+_RELOAD_KEYS = {"depends_on", "ready", "reuse", "restart"}
+
+
+class ReloadResult(NamedTuple):
+    """
+    Result of reloading one of the containers.
+
+    Attributes
+    ----------
+    container: Container
+        The created container.
+    remove_time: float
+        Seconds spent on removing the old container.
+    start_time: float
+        Seconds spent on starting the container, including readiness probe.
+    """
+    container: Container
+    remove_time: float
+    start_time: float
+
+
+def reload_docker_containers(
+    specs: dict[str, dict[str, Any]],
+    max_workers: int | None = None
+) -> dict[str, ReloadResult]:
+    '''
+    Reload several containers at the same time. Independent containers are
+    removed and started concurrently in the thread pool. A container is
+    removed after the containers that depend on it, and started after its
+    dependencies are started (and ready, if they have readiness probe).
+
+    Parameters
+    ----------
+    specs: dict[str, dict[str, Any]]
+        Names of the containers and keywords for the `reload_docker_container`
+        for each of them, including "ready", "reuse" and "restart". Reused
+        containers are neither removed nor started again. Also the spec can
+        contain "depends_on" - the list of names of the containers from
+        `specs` that must be started first.
+    max_workers: int | None
+        Maximum number of threads.
+
+    Returns
+    -------
+    dict[str, ReloadResult]
+        Created containers and timings by the names.
+    '''
+    depends_on = {
+        name: set(spec.get("depends_on", ()))
+        for name, spec in specs.items()
+    }
+    for name, dependencies in depends_on.items():
+        unknown = dependencies - specs.keys()
+        if unknown:
+            raise ValueError(f"Unknown dependencies of {name}: {unknown}")
+
+    # Graph of the steps: each step is ("remove" | "run", name) mapped to the
+    # steps that must be finished before it.
+    graph: dict[tuple[str, str], set[tuple[str, str]]] = {}
+    for name, dependencies in depends_on.items():
+        graph[("run", name)] = {("remove", name)} | {
+            ("run", dependency) for dependency in dependencies
+        }
+        graph.setdefault(("remove", name), set())
+        for dependency in dependencies:
+            graph.setdefault(("remove", dependency), set()).add(
+                ("remove", name)
+            )
+
+    # Keywords of the `docker.client.containers.run()` for each container,
+    # with the label of the configuration for the reusable ones.
+    run_kwargs = {}
+    for name, spec in specs.items():
+        kwargs = {
+            key: value for key, value in spec.items()
+            if key not in _RELOAD_KEYS
+        }
+        if spec.get("reuse"):
+            kwargs = _with_config_label(kwargs, config_hash(kwargs))
+        run_kwargs[name] = kwargs
+    # Containers found by the "remove" step that are reused as they are.
+    reused: dict[str, Container] = {}
+
+    def step(action: str, name: str) -> tuple[Any, float]:
+        start = time.perf_counter()
+        spec = specs[name]
+        if action == "remove":
+            output = None
+            if spec.get("reuse"):
+                output = _find_reusable(
+                    name, run_kwargs[name]["labels"][CONFIG_LABEL]
+                )
+            if output is None:
+                _remove_container(name)
+            else:
+                reused[name] = output
+        elif name in reused:
+            output = _resume_container(
+                reused[name],
+                restart=spec.get("restart", False),
+                ready=spec.get("ready")
+            )
+        else:
+            output = _run_container(
+                name=name, ready=spec.get("ready"), **run_kwargs[name]
+            )
+        return output, time.perf_counter() - start
+
+    sorter = TopologicalSorter(graph)
+    sorter.prepare()
+    outputs: dict[tuple[str, str], tuple[Any, float]] = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        while sorter.is_active():
+            for node in sorter.get_ready():
+                running[executor.submit(step, *node)] = node
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = running.pop(future)
+                outputs[node] = future.result()
+                sorter.done(node)
+
+    return {
+        name: ReloadResult(
+            container=outputs[("run", name)][0],
+            remove_time=outputs[("remove", name)][1],
+            start_time=outputs[("run", name)][1]
+        )
+        for name in specs
+    }
@@ -1,12 +1,34 @@
 '''
 Tools for running jupyter kernels from the other jupyter runtime.
 '''
+import os
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import tempfile
+import threading
 from queue import Empty
 import multiprocessing
+from collections import OrderedDict
+from typing import AsyncIterator, Iterable
 from ipykernel.kernelapp import IPKernelApp
 from ipykernel.ipkernel import IPythonKernel
 from ipykernel.kernelbase import Kernel
 from jupyter_client.blocking import BlockingKernelClient
+from jupyter_client.asynchronous import AsyncKernelClient
+
+# Modules imported by the forkserver process, so kernels forked from it
+# don't import them again.
+DEFAULT_PRELOAD = [
+    "IPython",
+    "zmq",
+    "tornado",
+    "ipykernel.kernelapp",
+    "ipykernel.ipkernel",
+    "jupyter_client",
+]
 
 
 def _run_kernel_target(
@@ -29,9 +51,36 @@ def _run_kernel_target(
     )
 
 
+def get_context(
+    start_method: str = "spawn",
+    preload: list[str] | None = None
+) -> multiprocessing.context.BaseContext:
+    '''
+    Multiprocessing context for the kernel processes.
+
+    Parameters:
+    start_method: str
+        "spawn" or "forkserver". With "forkserver" kernels are forked from
+        the warm server process that has already imported `preload` modules.
+    preload: list[str] | None
+        Modules to be imported by the forkserver, `DEFAULT_PRELOAD` if not
+        specified. Takes effect only before the forkserver is started, that
+        is before the first kernel is started with "forkserver".
+    '''
+    if start_method not in ("spawn", "forkserver"):
+        raise ValueError(f"Unsupported start method: {start_method}")
+    context = multiprocessing.get_context(start_method)
+    if start_method == "forkserver":
+        context.set_forkserver_preload(
+            DEFAULT_PRELOAD if preload is None else preload
+        )
+    return context
+
+
 class IPKernelAppProcess:
     '''
-    Class implements the Jupyter kernel in the separate 'spawn' process.
+    Class implements the Jupyter kernel in the separate 'spawn' or
+    'forkserver' process.
 
     Parameters:
     connection_file: str
@@ -39,14 +88,22 @@ class IPKernelAppProcess:
         connection.
     kernel_class: Kernel
         Kernel class that implements kernel to be used in the application.
+    start_method: str
+        Start method of the process, see `get_context`.
+    preload: list[str] | None
+        Modules preloaded by the forkserver, see `get_context`.
     '''
 
     def __init__(
         self,
         connection_file: str,
-        kernel_class: Kernel = IPythonKernel
+        kernel_class: Kernel = IPythonKernel,
+        start_method: str = "spawn",
+        preload: list[str] | None = None
     ):
-        context = multiprocessing.get_context("spawn")
+        self.connection_file = connection_file
+        self.kernel_class = kernel_class
+        context = get_context(start_method=start_method, preload=preload)
         self.process = context.Process(
             target=_run_kernel_target,
             kwargs={
@@ -56,14 +113,306 @@ class IPKernelAppProcess:
         )
         self.process.start()
 
-    def __del__(self):
+    def terminate(self) -> None:
+        '''
+        Stop the kernel process.
+        '''
         self.process.terminate()
         self.process.join()
 
+    def __del__(self):
+        self.terminate()
+
+
+def wait_connection_file(connection_file: str, timeout: float = 60) -> None:
+    '''
+    Wait until the kernel writes the connection file.
+
+    Parameters:
+    connection_file: str
+        Path to the connection file.
+    timeout: float
+        Maximum time to wait in seconds.
+    '''
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with open(connection_file) as f:
+                json.load(f)
+            return
+        except (OSError, ValueError):
+            if time.monotonic() > deadline:
+                raise TimeoutError(
+                    f"Kernel didn't write connection file {connection_file}."
+                )
+            time.sleep(0.05)
+
+
+class KernelPool:
+    '''
+    Pool of the pre-started kernels. Keeps `size` idle kernels of each
+    requested kernel class, so `acquire` returns the connection file of the
+    kernel that is already running. Released kernels are restarted to get a
+    clean state.
+
+    Parameters:
+    size: int
+        Number of the idle kernels kept for each kernel class.
+    max_kernels: int
+        Maximum number of live kernels. The least recently used idle kernels
+        are stopped to start the new ones.
+    idle_timeout: float | None
+        Idle kernels older than this number of seconds are stopped.
+    connection_dir: str | None
+        Directory for the connection files, temporary directory is used if
+        not specified.
+    start_method: str
+        Start method of the kernel processes, see `get_context`.
+    preload: list[str] | None
+        Modules preloaded by the forkserver, see `get_context`.
+    '''
+
+    def __init__(
+        self,
+        size: int = 1,
+        max_kernels: int = 8,
+        idle_timeout: float | None = None,
+        connection_dir: str | None = None,
+        start_method: str = "spawn",
+        preload: list[str] | None = None
+    ):
+        if size < 0 or max_kernels < 1:
+            raise ValueError("Invalid size of the kernel pool.")
+        self.size = size
+        self.max_kernels = max_kernels
+        self.idle_timeout = idle_timeout
+        self.start_method = start_method
+        self.preload = preload
+        self._own_dir = connection_dir is None
+        self.connection_dir = (
+            tempfile.mkdtemp(prefix="kernel_pool_") if connection_dir is None
+            else connection_dir
+        )
+        self._lock = threading.RLock()
+        # Idle kernels in order of releasing, the least recently used first.
+        self._idle: OrderedDict[str, tuple[IPKernelAppProcess, float]] = (
+            OrderedDict()
+        )
+        self._busy: dict[str, IPKernelAppProcess] = {}
+
+    def __len__(self) -> int:
+        return len(self._idle) + len(self._busy)
+
+    def _idle_count(self, kernel_class: Kernel) -> int:
+        return sum(
+            kernel.kernel_class is kernel_class
+            for kernel, _ in self._idle.values()
+        )
+
+    def _stop(self, kernel: IPKernelAppProcess) -> None:
+        close_client(kernel.connection_file)
+        kernel.terminate()
+        try:
+            os.remove(kernel.connection_file)
+        except OSError:
+            pass
+
+    def _start(self, kernel_class: Kernel) -> IPKernelAppProcess:
+        '''
+        Start new kernel, stopping the least recently used idle kernel if the
+        pool is full.
+        '''
+        if len(self) >= self.max_kernels:
+            if not self._idle:
+                raise RuntimeError("All kernels of the pool are in use.")
+            _, (kernel, _) = self._idle.popitem(last=False)
+            self._stop(kernel)
+        connection_file = os.path.join(
+            self.connection_dir, f"kernel-{uuid.uuid4()}.json"
+        )
+        return IPKernelAppProcess(
+            connection_file=connection_file,
+            kernel_class=kernel_class,
+            start_method=self.start_method,
+            preload=self.preload
+        )
+
+    def prune(self) -> None:
+        '''
+        Stop kernels that are idle longer than `idle_timeout`.
+        '''
+        if self.idle_timeout is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            for connection_file, (kernel, since) in list(self._idle.items()):
+                if now - since > self.idle_timeout:
+                    del self._idle[connection_file]
+                    self._stop(kernel)
+
+    def warm(self, kernel_class: Kernel = IPythonKernel) -> None:
+        '''
+        Start kernels of the given class until there are `size` idle ones or
+        the pool is full.
+        '''
+        with self._lock:
+            while (
+                self._idle_count(kernel_class) < self.size
+                and len(self) < self.max_kernels
+            ):
+                kernel = self._start(kernel_class)
+                self._idle[kernel.connection_file] = (
+                    kernel, time.monotonic()
+                )
+
+    def acquire(
+        self,
+        kernel_class: Kernel = IPythonKernel,
+        timeout: float = 60
+    ) -> str:
+        '''
+        Take the kernel from the pool and start a new idle one instead.
+
+        Parameters:
+        kernel_class: Kernel
+            Kernel class that implements kernel to be used in the application.
+        timeout: float
+            Maximum time to wait for the kernel start, if there was no idle
+            kernel.
+
+        Returns:
+        str
+            Path to the connection file of the kernel.
+        '''
+        self.prune()
+        with self._lock:
+            for connection_file, (kernel, _) in self._idle.items():
+                if kernel.kernel_class is kernel_class:
+                    del self._idle[connection_file]
+                    break
+            else:
+                kernel = self._start(kernel_class)
+            self._busy[kernel.connection_file] = kernel
+            self.warm(kernel_class)
+
+        wait_connection_file(kernel.connection_file, timeout=timeout)
+        return kernel.connection_file
+
+    def release(self, connection_file: str, restart: bool = True) -> None:
+        '''
+        Return the kernel to the pool.
+
+        Parameters:
+        connection_file: str
+            Connection file returned by `acquire`.
+        restart: bool
+            Replace the kernel with the new one, so the next user gets clean
+            state. Otherwise the kernel is returned as is.
+        '''
+        with self._lock:
+            kernel = self._busy.pop(connection_file)
+            if restart:
+                self._stop(kernel)
+                self.warm(kernel.kernel_class)
+            else:
+                self._idle[connection_file] = (kernel, time.monotonic())
+        self.prune()
+
+    def close(self) -> None:
+        '''
+        Stop all kernels of the pool.
+        '''
+        with self._lock:
+            for kernel, _ in self._idle.values():
+                self._stop(kernel)
+            for kernel in self._busy.values():
+                self._stop(kernel)
+            self._idle.clear()
+            self._busy.clear()
+        if self._own_dir:
+            shutil.rmtree(self.connection_dir, ignore_errors=True)
+
+    def __enter__(self) -> "KernelPool":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+# Long-lived clients by connection file, with the signature of the file they
+# were created for.
+_clients: dict[str, tuple[tuple | None, BlockingKernelClient]] = {}
+
+
+def _file_signature(path: str) -> tuple | None:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def get_client(
+    connection_file: str,
+    timeout: float = 60
+) -> BlockingKernelClient:
+    '''
+    Returns client connected to the kernel determined by the given connection
+    file. The client is created once and reused by the following calls, it is
+    created again if the connection file has been changed since then, for
+    example by the restart of the kernel.
+
+    Parameters:
+    connection_file: str
+        Path to the connection file.
+    timeout: float
+        Maximum time to wait for the kernel to be ready.
+    '''
+    signature = _file_signature(connection_file)
+    cached = _clients.get(connection_file)
+    if cached is not None:
+        if cached[0] == signature:
+            return cached[1]
+        close_client(connection_file)
+
+    client = BlockingKernelClient()
+    client.load_connection_file(connection_file)
+    client.start_channels()
+    try:
+        client.wait_for_ready(timeout=timeout)
+    except BaseException:
+        client.stop_channels()
+        raise
+    _clients[connection_file] = (signature, client)
+    return client
+
+
+def close_client(connection_file: str) -> None:
+    '''
+    Stops the client created by `get_client` for the given connection file.
+    '''
+    cached = _clients.pop(connection_file, None)
+    if cached is not None:
+        cached[1].stop_channels()
+
+
+def _drain_shell(client: BlockingKernelClient) -> None:
+    '''
+    Discard the replies to the previous requests, so they don't pile up in
+    the shell channel of the long-lived client.
+    '''
+    while True:
+        try:
+            client.get_shell_msg(timeout=0)
+        except Empty:
+            return
+
 
 def get_messages(
     connection_file: str,
     code: str,
+    until_idle: bool = True,
+    timeout: float = 60
 ) -> list[dict]:
     '''
     Returns messages that corresponding of the given code on the kernel
@@ -74,18 +423,284 @@ def get_messages(
         Path to the connection file.
     code: str
         Code to be executed.
+    until_idle: bool
+        Collect messages of the execution until the kernel reports `idle`
+        status for it. Otherwise messages are collected until there are no
+        new messages for 5 seconds.
+    timeout: float
+        Maximum time in seconds to wait for the kernel to become idle.
     '''
-    client = BlockingKernelClient()
-    client.load_connection_file(connection_file)
-    client.start_channels()
-    client.execute(code)
+    client = get_client(connection_file)
+    _drain_shell(client)
+    msg_id = client.execute(code)
 
     ans_list = []
 
+    if not until_idle:
+        while True:
+            try:
+                ans_list.append(client.get_iopub_msg(timeout=5))
+            except Empty:
+                break
+        return ans_list
+
+    deadline = time.monotonic() + timeout
     while True:
         try:
-            ans_list.append(client.get_iopub_msg(timeout=5))
+            msg = client.get_iopub_msg(
+                timeout=max(deadline - time.monotonic(), 0)
+            )
         except Empty:
+            raise TimeoutError(
+                f"Kernel didn't finish the execution in {timeout} seconds."
+            )
+        if msg["parent_header"].get("msg_id") != msg_id:
+            continue
+        ans_list.append(msg)
+        if (
+            msg["msg_type"] == "status"
+            and msg["content"]["execution_state"] == "idle"
+        ):
             break
 
     return ans_list
+
+
+async def stream_messages(
+    connection_file: str,
+    code: str,
+    timeout: float = 60
+) -> AsyncIterator[dict]:
+    '''
+    Executes code on the kernel determined by the given connection file and
+    yields iopub messages of the execution as they arrive, until the kernel
+    reports `idle` status.
+
+    Parameters:
+    connection_file: str
+        Path to the connection file.
+    code: str
+        Code to be executed.
+    timeout: float
+        Maximum time in seconds for the whole execution.
+    '''
+    deadline = time.monotonic() + timeout
+    client = AsyncKernelClient()
+    client.load_connection_file(connection_file)
+    client.start_channels()
+    try:
+        await client.wait_for_ready(timeout=timeout)
+        msg_id = client.execute(code)
+        while True:
+            try:
+                msg = await client.get_iopub_msg(
+                    timeout=max(deadline - time.monotonic(), 0)
+                )
+            except Empty:
+                raise TimeoutError(
+                    f"Kernel didn't finish the execution in {timeout} seconds."
+                )
+            if msg["parent_header"].get("msg_id") != msg_id:
+                continue
+            yield msg
+            if (
+                msg["msg_type"] == "status"
+                and msg["content"]["execution_state"] == "idle"
+            ):
+                break
+    finally:
+        client.stop_channels()
+
+
+async def _collect(
+    connection_file: str,
+    code: str,
+    timeout: float
+) -> list[dict]:
+    return [
+        msg async for msg in stream_messages(
+            connection_file=connection_file,
+            code=code,
+            timeout=timeout
+        )
+    ]
+
+
+def _executions(
+    connection_files: Iterable[str],
+    code: str | Iterable[str]
+) -> list[tuple[str, str]]:
+    '''
+    Pairs of the connection file and the code to be executed on it.
+    '''
+    connection_files = list(connection_files)
+    if isinstance(code, str):
+        return [(file, code) for file in connection_files]
+    codes = list(code)
+    if len(codes) != len(connection_files):
+        raise ValueError("Number of codes doesn't match number of kernels.")
+    return list(zip(connection_files, codes))
+
+
+async def execute_on_kernels(
+    connection_files: Iterable[str],
+    code: str | Iterable[str],
+    timeout: float = 60
+) -> list[list[dict] | BaseException]:
+    '''
+    Executes code on several kernels at the same time and gathers messages
+    of each execution.
+
+    Parameters:
+    connection_files: Iterable[str]
+        Paths to the connection files of the kernels.
+    code: str | Iterable[str]
+        Code to be executed on every kernel or separate code for each kernel.
+    timeout: float
+        Maximum time in seconds for the execution on each kernel.
+
+    Returns:
+    list[list[dict] | BaseException]
+        Messages of each kernel in order of the connection files. If the
+        execution on the kernel has failed, for example with `TimeoutError`,
+        there is the exception instead.
+    '''
+    return await asyncio.gather(
+        *(
+            _collect(connection_file=file, code=snippet, timeout=timeout)
+            for file, snippet in _executions(connection_files, code)
+        ),
+        return_exceptions=True
+    )
+
+
+async def merge_messages(
+    connection_files: Iterable[str],
+    code: str | Iterable[str],
+    timeout: float = 60
+) -> AsyncIterator[tuple[str, dict | BaseException]]:
+    '''
+    Executes code on several kernels at the same time and yields messages of
+    all kernels in order of arrival.
+
+    Parameters:
+    connection_files: Iterable[str]
+        Paths to the connection files of the kernels.
+    code: str | Iterable[str]
+        Code to be executed on every kernel or separate code for each kernel.
+    timeout: float
+        Maximum time in seconds for the execution on each kernel.
+
+    Returns:
+    AsyncIterator[tuple[str, dict | BaseException]]
+        Connection file and the message. If the execution on the kernel has
+        failed, the exception is yielded instead of the message.
+    '''
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def produce(connection_file: str, snippet: str) -> None:
+        try:
+            async for msg in stream_messages(
+                connection_file=connection_file,
+                code=snippet,
+                timeout=timeout
+            ):
+                await queue.put((connection_file, msg))
+        except Exception as e:
+            await queue.put((connection_file, e))
+
+    tasks = [
+        asyncio.create_task(produce(file, snippet))
+        for file, snippet in _executions(connection_files, code)
+    ]
+    done = asyncio.gather(*tasks)
+    try:
+        while not (done.done() and queue.empty()):
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait(
+                [getter, done],
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if getter.done():
+                yield getter.result()
+            else:
+                getter.cancel()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def benchmark_startup(
+    repeat: int = 3,
+    preload: list[str] | None = None
+) -> dict[str, list[float]]:
+    '''
+    Measures time from requesting the kernel to the end of the first
+    execution on it for the different ways to start kernels:
+    - "spawn": new process that imports everything from scratch.
+    - "forkserver": process forked from the warm forkserver.
+    - "pool": kernel taken from the warmed up `KernelPool`.
+
+    Parameters:
+    repeat: int
+        Number of measurements for each way.
+    preload: list[str] | None
+        Modules preloaded by the forkserver, see `get_context`.
+
+    Returns:
+    dict[str, list[float]]
+        Measured times in seconds.
+    '''
+    def measure(start) -> float:
+        begin = time.perf_counter()
+        connection_file, stop = start()
+        try:
+            wait_connection_file(connection_file)
+            get_messages(connection_file=connection_file, code="pass")
+            return time.perf_counter() - begin
+        finally:
+            close_client(connection_file)
+            stop()
+
+    ans: dict[str, list[float]] = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for start_method in ("spawn", "forkserver"):
+            def start():
+                kernel = IPKernelAppProcess(
+                    connection_file=os.path.join(
+                        tmpdir, f"kernel-{uuid.uuid4()}.json"
+                    ),
+                    start_method=start_method,
+                    preload=preload
+                )
+                return kernel.connection_file, kernel.terminate
+
+            if start_method == "forkserver":
+                # Start of the forkserver itself is not a part of kernel
+                # start up.
+                measure(start)
+            ans[start_method] = [measure(start) for _ in range(repeat)]
+
+        with KernelPool(size=1, connection_dir=tmpdir) as pool:
+            pool.warm()
+            wait_connection_file(next(iter(pool._idle)))
+
+            def start():
+                connection_file = pool.acquire()
+                return connection_file, lambda: pool.release(connection_file)
+
+            ans["pool"] = []
+            for _ in range(repeat):
+                ans["pool"].append(measure(start))
+                # Let the replacement kernel start.
+                wait_connection_file(next(iter(pool._idle)))
+
+    return ans
+
+
+if __name__ == "__main__":
+    for method, times in benchmark_startup().items():
+        print(
+            f"{method}: {min(times):.3f} s min, "
+            f"{sum(times) / len(times):.3f} s mean"
+        )
@@ -1,14 +1,18 @@
 import os
+import asyncio
 import textwrap
 import tempfile
+import multiprocessing as mp
 
 from unittest.mock import MagicMock
-from unittest import IsolatedAsyncioTestCase
+from unittest import IsolatedAsyncioTestCase, TestCase
 
 from traitlets.config import Config
 
 
-from src.http_kernel.http_kernel import HttpKernel
+from src.http_kernel.http_kernel import HttpKernel, _read_request
+from src.http_kernel.ring_buffer import RingBuffer
+from src.http_kernel.capture import TIMESTAMP, CapturedRequest, CaptureStore
 
 
 class TestHttpKernel(IsolatedAsyncioTestCase):
@@ -72,3 +76,337 @@ class TestHttpKernel(IsolatedAsyncioTestCase):
         args, _ = self.kernel.send_response.call_args
         self.assertEqual(args[1], "stream")
         self.assertEqual(args[2]["text"], request_text)
+
+        captured = self.kernel.shell.user_ns["captured"](path="/ping")
+        self.assertEqual(len(captured), 1)
+        self.assertEqual(captured[0].method, "GET")
+        self.assertEqual(captured[0].headers["host"], "localhost")
+
+    async def test_drain_all_requests(self):
+        """
+        All requests of the cell are printed in one message, requests over
+        `max_requests` are dropped and reported.
+        """
+        self.kernel.max_requests = 3
+        self.kernel.grace_period = 0.5
+        code = textwrap.dedent("""
+            import socket
+            import time
+
+            for _ in range(50):
+                try:
+                    socket.create_connection(("127.0.0.1", 3232)).close()
+                    break
+                except OSError:
+                    time.sleep(0.05)
+
+            for i in range(5):
+                s = socket.create_connection(("127.0.0.1", 3232))
+                s.sendall(
+                    f"GET /{i} HTTP/1.1\\r\\nConnection: close\\r\\n\\r\\n"
+                    .encode()
+                )
+                s.recv(1024)
+                s.close()
+            """
+        )
+
+        result = await self.kernel.do_execute(
+            code=code,
+            silent=True,
+            store_history=False,
+        )
+
+        self.assertEqual(result["status"], "ok")
+        calls = self.kernel.send_response.call_args_list
+        self.assertEqual(len(calls), 2)
+        stdout = calls[0].args[2]
+        self.assertEqual(stdout["name"], "stdout")
+        self.assertEqual(stdout["text"].count("GET /"), 3)
+        self.assertEqual(calls[1].args[2]["name"], "stderr")
+        # Records are prefixed with the length and the time of receiving.
+        request = "GET /0 HTTP/1.1\r\nConnection: close\r\n\r\n"
+        depth = 5 * (4 + TIMESTAMP.size + len(request))
+        self.assertEqual(
+            self.kernel.capture_stats,
+            {"received": 5, "dropped": 2, "drained": 5, "depth": depth}
+        )
+
+    async def test_drain_open_connections(self):
+        """
+        Draining waits for the open connections and stops as soon as they
+        are closed, not at the end of `grace_period`.
+        """
+        self.kernel.grace_period = 5
+        loop = asyncio.get_running_loop()
+        log_queue = self.kernel.log_queue
+        log_queue.connections += 1
+
+        def close_connection():
+            log_queue.put(
+                TIMESTAMP.pack(0), b"GET /late HTTP/1.1\r\n\r\n"
+            )
+            log_queue.connections -= 1
+
+        loop.call_later(0.2, close_connection)
+        start = loop.time()
+        requests, dropped = await self.kernel._drain_requests()
+
+        self.assertLess(loop.time() - start, 2)
+        self.assertEqual(len(requests), 1)
+        self.assertTrue(requests[0].startswith("GET /late"))
+        self.assertEqual(dropped, 0)
+
+
+class TestReadRequest(IsolatedAsyncioTestCase):
+    async def read(self, data: bytes, eof: bool = False, **kwargs):
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        if eof:
+            reader.feed_eof()
+        writer = MagicMock()
+        return await _read_request(reader, writer, **kwargs), reader, writer
+
+    async def test_content_length(self):
+        """
+        Request ends after "Content-Length" bytes of the body, the rest
+        stays in the connection.
+        """
+        request = b"POST / HTTP/1.1\r\nContent-Length: 5\r\n\r\nhello"
+        (raw, keep_alive), reader, _ = await self.read(request + b"GET")
+        self.assertEqual(raw, request)
+        self.assertTrue(keep_alive)
+        self.assertEqual(await reader.read(3), b"GET")
+
+    async def test_chunked(self):
+        request = (
+            b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n"
+            b"3\r\nabc\r\n2;ext=1\r\nde\r\n0\r\nX-Trailer: 1\r\n\r\n"
+        )
+        (raw, keep_alive), _, _ = await self.read(request)
+        self.assertEqual(raw, request)
+        self.assertTrue(keep_alive)
+
+    async def test_connection_close(self):
+        request = b"GET / HTTP/1.1\r\nConnection: close\r\n\r\n"
+        (raw, keep_alive), _, _ = await self.read(request)
+        self.assertEqual(raw, request)
+        self.assertFalse(keep_alive)
+
+    async def test_incomplete(self):
+        """
+        Connection closed before the end of the request.
+        """
+        request = b"POST / HTTP/1.1\r\nContent-Length: 10\r\n\r\nhel"
+        (raw, keep_alive), _, _ = await self.read(request, eof=True)
+        self.assertEqual(raw, request)
+        self.assertFalse(keep_alive)
+
+        (raw, keep_alive), _, _ = await self.read(b"GET / HTT", eof=True)
+        self.assertEqual(raw, b"GET / HTT")
+        self.assertFalse(keep_alive)
+
+    async def test_invalid_content_length(self):
+        """
+        Request with the negative or invalid length ends with its head, the
+        connection is closed.
+        """
+        for length in (b"-5", b"abc"):
+            head = (
+                b"POST / HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n"
+            )
+            (raw, keep_alive), _, _ = await self.read(head + b"body")
+            self.assertEqual(raw, head)
+            self.assertFalse(keep_alive)
+
+    async def test_large_content_length(self):
+        """
+        Only `capacity` bytes are allocated in advance, the rest of the body
+        is appended as it arrives.
+        """
+        request = b"POST / HTTP/1.1\r\nContent-Length: 99999999999999\r\n\r\n"
+        (raw, keep_alive), _, _ = await self.read(
+            request + b"x" * 100, eof=True, capacity=64
+        )
+        self.assertEqual(raw, request + b"x" * 100)
+        self.assertFalse(keep_alive)
+
+        request = b"POST / HTTP/1.1\r\nContent-Length: 100\r\n\r\n"
+        (raw, keep_alive), _, _ = await self.read(
+            request + b"y" * 100, capacity=64
+        )
+        self.assertEqual(raw, request + b"y" * 100)
+        self.assertTrue(keep_alive)
+
+    async def test_read_error(self):
+        """
+        Received part of the request is returned if reading fails.
+        """
+        reader = asyncio.StreamReader()
+        request = b"POST / HTTP/1.1\r\nContent-Length: 10\r\n\r\nhel"
+        reader.feed_data(request)
+        read = reader.read
+        calls = []
+
+        async def broken_read(n: int) -> bytes:
+            calls.append(n)
+            if len(calls) == 1:
+                return await read(n)
+            raise RuntimeError("broken")
+
+        reader.read = broken_read
+        with self.assertLogs("src.http_kernel.http_kernel", "ERROR"):
+            raw, keep_alive = await _read_request(reader, MagicMock())
+        self.assertEqual(raw, request)
+        self.assertFalse(keep_alive)
+
+    async def test_expect_continue(self):
+        request = (
+            b"POST / HTTP/1.1\r\nContent-Length: 1\r\n"
+            b"Expect: 100-continue\r\n\r\na"
+        )
+        _, _, writer = await self.read(request)
+        writer.write.assert_called_once_with(
+            b"HTTP/1.1 100 Continue\r\n\r\n"
+        )
+
+
+def _put_records(buffer: RingBuffer, count: int):
+    for i in range(count):
+        buffer.put(f"record {i}".encode())
+
+
+class TestRingBuffer(TestCase):
+    def setUp(self):
+        self.buffer = RingBuffer(capacity=64)
+
+    def tearDown(self):
+        self.buffer.close()
+
+    def read_all(self) -> list[bytes]:
+        return [bytes(record) for record in self.buffer.records()]
+
+    def test_put_read(self):
+        self.assertTrue(self.buffer.put(b"hello"))
+        self.assertTrue(self.buffer.put(bytearray(b"world")))
+        self.assertEqual(self.read_all(), [b"hello", b"world"])
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(self.read_all(), [])
+
+    def test_wrap_around(self):
+        """
+        Records stay contiguous when the end of the buffer is reached.
+        """
+        for i in range(20):
+            record = bytes([i]) * (5 + i % 13)
+            self.assertTrue(self.buffer.put(record))
+            self.assertEqual(self.read_all(), [record])
+
+    def test_drop(self):
+        """
+        Records that don't fit into the free space are dropped.
+        """
+        self.assertTrue(self.buffer.put(b"a" * 40))
+        self.assertFalse(self.buffer.put(b"b" * 40))
+        self.assertFalse(self.buffer.put(b"c" * 100))
+        self.assertEqual(self.buffer.dropped, 2)
+        self.assertEqual(self.read_all(), [b"a" * 40])
+        self.assertTrue(self.buffer.put(b"b" * 40))
+
+    def test_other_process(self):
+        buffer = RingBuffer(capacity=1024)
+        process = mp.get_context("spawn").Process(
+            target=_put_records,
+            args=(buffer, 3)
+        )
+        process.start()
+        process.join()
+        self.assertEqual(
+            [bytes(record) for record in buffer.records()],
+            [b"record 0", b"record 1", b"record 2"]
+        )
+        buffer.close()
+
+
+class TestCapturedRequest(TestCase):
+    def test_parse(self):
+        raw = (
+            b"POST /api/items?id=1 HTTP/1.1\r\n"
+            b"Content-Type: application/json\r\n"
+            b"Content-Length: 2\r\n"
+            b"\r\n"
+            b"{}"
+        )
+        request = CapturedRequest.parse(raw=memoryview(raw), time=10.0)
+        self.assertEqual(
+            (request.method, request.path, request.query, request.version),
+            ("POST", "/api/items", "id=1", "HTTP/1.1")
+        )
+        self.assertEqual(request.headers["content-type"], "application/json")
+        self.assertEqual(request.body, b"{}")
+        self.assertEqual(request.size, len(raw))
+
+    def test_chunked(self):
+        raw = (
+            b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n"
+            b"3\r\nabc\r\n2\r\nde\r\n0\r\n\r\n"
+        )
+        request = CapturedRequest.parse(raw=raw, time=0.0)
+        self.assertEqual(request.body, b"abcde")
+
+    def test_incomplete(self):
+        request = CapturedRequest.parse(raw=b"GET /a", time=0.0)
+        self.assertEqual((request.method, request.path), ("GET", "/a"))
+        self.assertEqual(request.body, b"")
+
+
+class TestCaptureStore(TestCase):
+    def make_request(self, method: str, path: str, time: float):
+        return CapturedRequest.parse(
+            raw=f"{method} {path} HTTP/1.1\r\n\r\n".encode(),
+            time=time
+        )
+
+    def setUp(self):
+        self.store = CaptureStore()
+        for i, (method, path) in enumerate([
+            ("GET", "/api/a"),
+            ("POST", "/api/b"),
+            ("GET", "/other"),
+            ("GET", "/api/a"),
+            ("DELETE", "/api/b"),
+        ]):
+            self.store.add(self.make_request(method, path, float(i)))
+
+    def times(self, **kwargs) -> list[float]:
+        return [request.time for request in self.store.query(**kwargs)]
+
+    def test_query(self):
+        self.assertEqual(self.times(), [0, 1, 2, 3, 4])
+        self.assertEqual(self.times(path="/api/a"), [0, 3])
+        self.assertEqual(self.times(path="/api/*"), [0, 1, 3, 4])
+        self.assertEqual(self.times(method="get"), [0, 2, 3])
+        self.assertEqual(self.times(path="/api/*", method="GET"), [0, 3])
+        self.assertEqual(self.times(path="/api/*", since=1.0), [1, 3, 4])
+        self.assertEqual(self.times(method="GET", until=3.0), [0, 2])
+        self.assertEqual(self.times(path="/missing"), [])
+
+    def test_eviction(self):
+        """
+        The oldest requests are removed from the store and the indexes.
+        """
+        self.store.max_requests = 3
+        self.store.add(self.make_request("GET", "/new", 5.0))
+        self.assertEqual(len(self.store), 3)
+        self.assertEqual(self.store.evicted, 3)
+        self.assertEqual(self.times(path="/api/a"), [3])
+        self.assertEqual(self.times(method="POST"), [])
+        self.assertEqual(self.times(), [3, 4, 5])
+
+    def test_max_bytes(self):
+        request = self.make_request("GET", "/x", 5.0)
+        store = CaptureStore(max_bytes=2 * request.size)
+        for _ in range(3):
+            store.add(request)
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.size, 2 * request.size)
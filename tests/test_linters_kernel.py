@@ -0,0 +1,311 @@
+import io
+import os
+import time
+import tempfile
+import importlib.util
+from pathlib import Path
+from unittest import TestCase, skipUnless
+from unittest.mock import patch, MagicMock
+
+from src.linters_kernel.cache import LintCache
+from src.linters_kernel.mypy_worker import MypyWorker
+from src.linters_kernel.runner import LintRunner, LintResult, format_report
+
+from src.linters_kernel.daemons import (
+    Dmypy,
+    Workspace,
+    format_diagnostics,
+    _read_message,
+    _write_message
+)
+
+
+class TestDaemons(TestCase):
+    def setUp(self):
+        self.workspace = Workspace()
+
+    def tearDown(self):
+        self.workspace.cleanup()
+
+    def test_workspace(self):
+        """
+        Cells are written to the same file, the workspace is removed by
+        cleanup.
+        """
+        first = self.workspace.write("x = 1")
+        second = self.workspace.write("x = 2")
+        self.assertEqual(first, second)
+        self.assertEqual(second.read_text(), "x = 2")
+
+        self.workspace.cleanup()
+        self.assertFalse(self.workspace.path.exists())
+
+    def test_dmypy_command(self):
+        dmypy = Dmypy(self.workspace, args=["--strict"])
+        path = self.workspace.write("x = 1")
+        command = dmypy.command(path)
+        self.assertEqual(command[:3], ["dmypy", "--status-file", str(
+            self.workspace.path / ".dmypy.json"
+        )])
+        self.assertEqual(command[-2:], ["--strict", str(path)])
+
+    def test_messages(self):
+        stream = io.BytesIO()
+        _write_message(stream, {"id": 1, "result": "ö"})
+        _write_message(stream, {"method": "exit"})
+        stream.seek(0)
+        self.assertEqual(_read_message(stream), {"id": 1, "result": "ö"})
+        self.assertEqual(_read_message(stream), {"method": "exit"})
+        self.assertIsNone(_read_message(stream))
+
+    def test_format_diagnostics(self):
+        diagnostics = [
+            {
+                "range": {"start": {"line": 0, "character": 9}},
+                "severity": 1,
+                "message": "Wrong type",
+                "code": "reportAssignmentType"
+            },
+            {
+                "range": {"start": {"line": 2, "character": 0}},
+                "severity": 2,
+                "message": "Unused"
+            }
+        ]
+        self.assertEqual(
+            format_diagnostics(Path("cell.py"), diagnostics),
+            "cell.py:1:10 - error: Wrong type (reportAssignmentType)\n"
+            "cell.py:3:1 - warning: Unused\n"
+            "1 errors, 1 warnings, 0 informations\n"
+        )
+
+
+class TestLintCache(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_key(self):
+        key = LintCache.key("mypy", "1.0", ["--strict"], "x = 1")
+        self.assertEqual(
+            key, LintCache.key("mypy", "1.0", ["--strict"], "x = 1")
+        )
+        for other in (
+            LintCache.key("pyright", "1.0", ["--strict"], "x = 1"),
+            LintCache.key("mypy", "1.1", ["--strict"], "x = 1"),
+            LintCache.key("mypy", "1.0", [], "x = 1"),
+            LintCache.key("mypy", "1.0", ["--strict"], "x = 2"),
+        ):
+            self.assertNotEqual(key, other)
+
+    def test_get_put(self):
+        """
+        Outputs are kept between the instances of the cache.
+        """
+        cache = LintCache(self.directory.name)
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", "output")
+        self.assertEqual(cache.get("a"), "output")
+        self.assertEqual(cache.info()[:2], (1, 1))
+
+        cache = LintCache(self.directory.name)
+        self.assertEqual(cache.get("a"), "output")
+        self.assertEqual(cache.info().currsize, len("output"))
+
+        cache.clear()
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_eviction(self):
+        """
+        The least recently used outputs are evicted.
+        """
+        cache = LintCache(self.directory.name, maxsize=10)
+        cache.put("a", "aaaa")
+        cache.put("b", "bbbb")
+        old = time.time() - 10
+        os.utime(Path(self.directory.name) / "b", (old, old))
+        cache.put("c", "cccc")
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), "aaaa")
+        self.assertEqual(cache.get("c"), "cccc")
+        info = cache.info()
+        self.assertEqual((info.evictions, info.currsize), (1, 8))
+
+
+class TestLintRunner(TestCase):
+    def setUp(self):
+        self.workspace = Workspace()
+        self.directory = tempfile.TemporaryDirectory()
+        self.runner = LintRunner(
+            self.workspace, LintCache(self.directory.name)
+        )
+
+    def tearDown(self):
+        self.workspace.cleanup()
+        self.directory.cleanup()
+
+    def test_parallel(self):
+        """
+        Linters are run at the same time, outputs are returned in the given
+        order.
+        """
+        def run(tool, path, code, on_output):
+            time.sleep(0.3)
+            on_output("part")
+            return f"{tool}: {path.read_text()}"
+
+        outputs = []
+        with patch.object(self.runner, "_run", side_effect=run) as run_mock:
+            start = time.perf_counter()
+            results = self.runner.check(
+                ["mypy", "pyright", "ruff"],
+                "x",
+                on_output=lambda tool, text: outputs.append((tool, text))
+            )
+            self.assertLess(time.perf_counter() - start, 0.8)
+            self.assertEqual(
+                [result.output for result in results],
+                ["mypy: x", "pyright: x", "ruff: x"]
+            )
+
+            results = self.runner.check(["ruff", "mypy"], "x")
+            self.assertTrue(all(result.cached for result in results))
+            self.assertEqual(run_mock.call_count, 3)
+        self.assertEqual(
+            sorted(outputs),
+            [("mypy", "part"), ("pyright", "part"), ("ruff", "part")]
+        )
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            self.runner.check(["pylint"], "x")
+
+    def test_format_report(self):
+        self.assertEqual(
+            format_report([
+                LintResult("mypy", "ok\n", 0.5, False),
+                LintResult("ruff", "ok\n", 0, True)
+            ]),
+            "==== mypy (0.50 s) ====\nok\n\n==== ruff (cached) ====\nok\n"
+        )
+
+
+class TestMypyWorker(TestCase):
+    def test_run(self):
+        """
+        Checks are run one after another in the same process, the output is
+        sent in parts.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "cell.py"
+            worker = MypyWorker(cache_dir=Path(tmpdir) / "cache")
+            try:
+                path.write_text('x: int = "a"\n')
+                parts = list(worker.run(["cell.py"], cwd=tmpdir))
+                self.assertGreater(len(parts), 1)
+                self.assertTrue(parts[0].startswith("cell.py:1:"))
+                self.assertEqual(worker.exit_status, 1)
+
+                path.write_text("x: int = 1\n")
+                output = "".join(worker.run(["cell.py"], cwd=tmpdir))
+                self.assertIn("Success", output)
+                self.assertEqual(worker.exit_status, 0)
+                self.assertTrue((Path(tmpdir) / "cache").is_dir())
+            finally:
+                worker.close()
+
+    def test_abandoned_run(self):
+        """
+        Output of the run that was not read to the end doesn't get into the
+        next run.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "cell.py"
+            worker = MypyWorker(cache_dir=Path(tmpdir) / "cache")
+            try:
+                path.write_text('x: int = "a"\n')
+                run = worker.run(["cell.py"], cwd=tmpdir)
+                next(run)
+                run.close()
+
+                path.write_text("x: int = 1\n")
+                output = "".join(worker.run(["cell.py"], cwd=tmpdir))
+                self.assertIn("Success", output)
+                self.assertNotIn("error", output)
+                self.assertEqual(worker.exit_status, 0)
+            finally:
+                worker.close()
+
+
+HAS_COMMAND_KERNEL = importlib.util.find_spec("command_kernel") is not None
+
+
+@skipUnless(HAS_COMMAND_KERNEL, "command_kernel is required")
+class TestLintersKernel(TestCase):
+    def setUp(self):
+        from src.linters_kernel.kernel import LintersKernel
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.kernel = LintersKernel()
+        self.kernel.send_response = MagicMock()
+        self.kernel._runner = LintRunner(
+            self.kernel.workspace, LintCache(self.directory.name)
+        )
+        self.run = patch.object(
+            self.kernel._runner,
+            "_run",
+            side_effect=lambda tool, path, code, on_output: f"{tool} ok\n"
+        ).start()
+
+    def tearDown(self):
+        patch.stopall()
+        self.kernel.do_shutdown(False)
+        self.directory.cleanup()
+
+    def output(self, name: str = "stdout") -> str:
+        """
+        Text sent to the given stream of the cell.
+        """
+        return "".join(
+            call.args[2]["text"]
+            for call in self.kernel.send_response.call_args_list
+            if call.args[1] == "stream" and call.args[2]["name"] == name
+        )
+
+    def test_lint(self):
+        """
+        Report of the linters is sent to the cell, no files are left in the
+        workspace except the checked cell.
+        """
+        self.assertEqual(self.kernel.lint("x = 1", "mypy", "ruff"), "true")
+        output = self.output()
+        self.assertIn("==== mypy (", output)
+        self.assertIn("mypy ok", output)
+        self.assertIn("ruff ok", output)
+        self.assertNotIn("pyright", output)
+        self.assertEqual(
+            [path.name for path in self.kernel.workspace.path.iterdir()],
+            ["cell.py"]
+        )
+
+    def test_unknown_tools(self):
+        self.assertEqual(self.kernel.lint("x = 1", "mypy", "black"), "false")
+        self.assertIn("black", self.output("stderr"))
+        self.assertEqual(self.output(), "")
+        self.run.assert_not_called()
+
+    def test_lint_cache(self):
+        self.kernel.ruff("x = 1")
+        self.kernel.ruff("x = 1")
+        self.kernel.send_response.reset_mock()
+        self.kernel.lint_cache("")
+        self.assertIn("hits=1, misses=1", self.output())
+
+        self.kernel.send_response.reset_mock()
+        self.kernel.lint_cache("clear")
+        self.assertIn("hits=0, misses=0", self.output())
+        self.assertIn("currsize=0", self.output())
@@ -0,0 +1,355 @@
+import time
+import socket
+import threading
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+from docker.errors import NotFound
+
+import src.rerun_docker
+from src.rerun_docker import (
+    get_client,
+    check_container,
+    clear_container_index,
+    ensure_container_remove,
+    reload_docker_container,
+    reload_docker_containers,
+    config_hash,
+    wait_port,
+    wait_log,
+    wait_healthy
+)
+
+
+def fake_container(name: str, auto_remove: bool = False) -> MagicMock:
+    container = MagicMock()
+    container.name = name
+    container.attrs = {
+        "Names": [f"/{name}"],
+        "HostConfig": {"AutoRemove": auto_remove}
+    }
+    return container
+
+
+class TestClient(TestCase):
+    def test_lazy_client(self):
+        """
+        Client is created on the first use only.
+        """
+        with (
+            patch.object(src.rerun_docker, "client", None),
+            patch("docker.from_env") as from_env
+        ):
+            from_env.assert_not_called()
+            self.assertIs(get_client(), from_env.return_value)
+            self.assertIs(get_client(), from_env.return_value)
+            from_env.assert_called_once()
+
+
+@patch.object(src.rerun_docker, "client")
+class TestContainerLifecycle(TestCase):
+    def setUp(self):
+        clear_container_index()
+
+    def test_check_container(self, client: MagicMock):
+        """
+        Containers are looked up with the name filter, names that only
+        contain the given name don't count.
+        """
+        client.containers.list.return_value = [fake_container("db_2")]
+        self.assertFalse(check_container("db"))
+        client.containers.list.assert_called_once_with(
+            filters={"name": "^/db$"},
+            sparse=True
+        )
+
+        client.containers.list.return_value = [fake_container("db")]
+        self.assertTrue(check_container("db", ttl=0))
+
+    def test_name_index(self, client: MagicMock):
+        """
+        Result of the check is reused, removed and created containers are
+        tracked without requests.
+        """
+        container = fake_container("db")
+        client.containers.list.return_value = [container]
+        self.assertTrue(check_container("db"))
+        self.assertTrue(check_container("db"))
+        client.containers.list.assert_called_once()
+
+        ensure_container_remove(container)
+        self.assertFalse(check_container("db"))
+        reload_docker_container("db", image="postgres")
+        self.assertTrue(check_container("db"))
+        client.containers.list.assert_called_once()
+
+        clear_container_index("db")
+        check_container("db")
+        self.assertEqual(client.containers.list.call_count, 2)
+
+    def test_remove(self, client: MagicMock):
+        container = fake_container("db")
+        ensure_container_remove(container)
+        container.stop.assert_called_once()
+        container.remove.assert_called_once_with(force=True)
+        container.wait.assert_not_called()
+
+    def test_auto_remove(self, client: MagicMock):
+        """
+        Removal of the auto remove container is awaited without polling,
+        the container can be already removed.
+        """
+        container = fake_container("db", auto_remove=True)
+        ensure_container_remove(container, timeout=5)
+        container.remove.assert_not_called()
+        container.wait.assert_called_once_with(condition="removed", timeout=5)
+
+        container.wait.side_effect = NotFound("removed")
+        ensure_container_remove(container)
+        client.containers.list.assert_not_called()
+
+    def test_reload(self, client: MagicMock):
+        old = fake_container("db")
+        client.containers.list.return_value = [old]
+        client.containers.get.return_value = old
+        ready = MagicMock()
+
+        container = reload_docker_container(
+            "db", ready=ready, image="postgres"
+        )
+
+        old.remove.assert_called_once_with(force=True)
+        client.containers.run.assert_called_once_with(
+            name="db", image="postgres"
+        )
+        self.assertIs(container, client.containers.run.return_value)
+        ready.assert_called_once_with(container)
+
+    def test_config_hash(self, client: MagicMock):
+        self.assertEqual(
+            config_hash({"image": "postgres", "ports": {"5432/tcp": 5432}}),
+            config_hash({"ports": {"5432/tcp": 5432}, "image": "postgres"})
+        )
+        self.assertNotEqual(
+            config_hash({"image": "postgres"}),
+            config_hash({"image": "postgres:16"})
+        )
+
+    def test_reuse(self, client: MagicMock):
+        """
+        Running container with the same configuration is returned as it is.
+        """
+        old = fake_container("db")
+        old.status = "running"
+        old.labels = {"rerun_docker.config": config_hash({"image": "pg"})}
+        client.containers.list.return_value = [old]
+        client.containers.get.return_value = old
+        ready = MagicMock()
+
+        container = reload_docker_container(
+            "db", ready=ready, reuse=True, restart=True, image="pg"
+        )
+
+        self.assertIs(container, old)
+        old.restart.assert_called_once()
+        old.remove.assert_not_called()
+        client.containers.run.assert_not_called()
+        ready.assert_called_once_with(old)
+
+    def test_reuse_changed(self, client: MagicMock):
+        """
+        Container is recreated if configuration differs, new container gets
+        the label with the hash of the configuration.
+        """
+        old = fake_container("db")
+        old.status = "running"
+        old.labels = {"rerun_docker.config": config_hash({"image": "pg"})}
+        client.containers.list.return_value = [old]
+        client.containers.get.return_value = old
+
+        reload_docker_container(
+            "db", reuse=True, image="pg:16", labels=["team"]
+        )
+
+        old.remove.assert_called_once_with(force=True)
+        client.containers.run.assert_called_once_with(
+            name="db",
+            image="pg:16",
+            labels={
+                "team": "",
+                "rerun_docker.config": config_hash(
+                    {"image": "pg:16", "labels": ["team"]}
+                )
+            }
+        )
+
+
+@patch.object(src.rerun_docker, "client")
+class TestReadiness(TestCase):
+    def test_wait_port(self, client: MagicMock):
+        with socket.socket() as server:
+            server.bind(("127.0.0.1", 0))
+            server.listen()
+            container = fake_container("web")
+            container.attrs["NetworkSettings"] = {"Ports": {
+                "80/tcp": [{"HostIp": "0.0.0.0", "HostPort": str(
+                    server.getsockname()[1]
+                )}]
+            }}
+            wait_port(container, 80, timeout=1)
+
+        with self.assertRaises(TimeoutError):
+            wait_port(container, 80, timeout=0)
+
+    def test_wait_log(self, client: MagicMock):
+        container = fake_container("web")
+        stream = MagicMock()
+        stream.__iter__.return_value = iter([b"starting\n", b"ready\n"])
+        container.logs.return_value = stream
+
+        wait_log(container, "ready", timeout=1)
+        stream.close.assert_called()
+
+        stream.__iter__.return_value = iter([b"starting\n"])
+        with self.assertRaises(TimeoutError):
+            wait_log(container, "ready", timeout=1)
+
+    def test_wait_log_chunks(self, client: MagicMock):
+        """
+        Text split between the chunks of the stream is found, text split
+        between the lines is not.
+        """
+        container = fake_container("web")
+        stream = MagicMock()
+        container.logs.return_value = stream
+
+        stream.__iter__.return_value = iter(
+            [b"starting\nser", b"ver re", b"ady\nmore"]
+        )
+        wait_log(container, "server ready", timeout=1)
+
+        stream.__iter__.return_value = iter([b"server\n", b"ready\n"])
+        with self.assertRaises(TimeoutError):
+            wait_log(container, "server ready", timeout=1)
+
+        stream.__iter__.return_value = iter([b"server ", b"ready"])
+        wait_log(container, "server ready", timeout=1)
+
+    def test_wait_healthy(self, client: MagicMock):
+        container = fake_container("web")
+        container.attrs["State"] = {"Health": {"Status": "starting"}}
+        events = MagicMock()
+        events.__iter__.return_value = iter([
+            {"status": "health_status: unhealthy"},
+            {"status": "health_status: healthy"},
+        ])
+        client.events.return_value = events
+
+        wait_healthy(container, timeout=1)
+        self.assertEqual(
+            client.events.call_args.kwargs["filters"],
+            {"container": container.id, "event": "health_status"}
+        )
+
+        events.__iter__.return_value = iter([])
+        with self.assertRaises(TimeoutError):
+            wait_healthy(container, timeout=1)
+
+        container.attrs["State"] = {"Health": {"Status": "healthy"}}
+        wait_healthy(container, timeout=1)
+
+
+@patch.object(src.rerun_docker, "client")
+class TestReloadContainers(TestCase):
+    def setUp(self):
+        clear_container_index()
+        self.events: list[tuple[str, str]] = []
+        self.lock = threading.Lock()
+
+    def log(self, action: str, name: str):
+        with self.lock:
+            self.events.append((action, name))
+
+    def setup_client(self, client: MagicMock, delay: float = 0):
+        existing = {
+            name: fake_container(name) for name in ("db", "cache", "api")
+        }
+        for name, container in existing.items():
+            container.remove.side_effect = (
+                lambda force, name=name: self.log("remove", name)
+            )
+        client.containers.list.side_effect = lambda filters, **kwargs: [
+            existing[filters["name"][2:-1]]
+        ]
+        client.containers.get.side_effect = existing.get
+
+        def run(name, **kwargs):
+            time.sleep(delay)
+            self.log("run", name)
+            return fake_container(name)
+        client.containers.run.side_effect = run
+
+    def test_dependencies(self, client: MagicMock):
+        """
+        Containers are removed after their dependents and started after their
+        dependencies.
+        """
+        self.setup_client(client)
+        out = reload_docker_containers({
+            "api": {"image": "api", "depends_on": ["db", "cache"]},
+            "db": {"image": "postgres"},
+            "cache": {"image": "redis"},
+        })
+
+        self.assertEqual(set(out), {"api", "db", "cache"})
+        self.assertEqual(out["api"].container.name, "api")
+        self.assertGreaterEqual(out["db"].start_time, 0)
+        order = self.events.index
+        for dependency in ("db", "cache"):
+            self.assertLess(
+                order(("remove", "api")), order(("remove", dependency))
+            )
+            self.assertLess(order(("run", dependency)), order(("run", "api")))
+        client.containers.run.assert_any_call(name="api", image="api")
+
+    def test_parallel(self, client: MagicMock):
+        self.setup_client(client, delay=0.3)
+        start = time.perf_counter()
+        reload_docker_containers({
+            "db": {"image": "postgres"},
+            "cache": {"image": "redis"},
+            "api": {"image": "api"},
+        })
+        self.assertLess(time.perf_counter() - start, 0.8)
+
+    def test_reuse(self, client: MagicMock):
+        """
+        Reusable container is neither removed nor started, its dependents are
+        reloaded as usual.
+        """
+        self.setup_client(client)
+        db = client.containers.get("db")
+        db.status = "running"
+        db.labels = {"rerun_docker.config": config_hash({"image": "pg"})}
+        ready = MagicMock()
+
+        out = reload_docker_containers({
+            "db": {"image": "pg", "reuse": True, "restart": True},
+            "api": {"image": "api", "depends_on": ["db"], "ready": ready},
+        })
+
+        self.assertIs(out["db"].container, db)
+        db.restart.assert_called_once()
+        self.assertEqual(self.events, [("remove", "api"), ("run", "api")])
+        client.containers.run.assert_called_once_with(name="api", image="api")
+        ready.assert_called_once_with(out["api"].container)
+
+    def test_invalid_dependencies(self, client: MagicMock):
+        with self.assertRaises(ValueError):
+            reload_docker_containers({"api": {"depends_on": ["db"]}})
+        with self.assertRaises(ValueError):
+            reload_docker_containers({
+                "api": {"depends_on": ["db"]},
+                "db": {"depends_on": ["api"]},
+            })
+        client.containers.run.assert_not_called()
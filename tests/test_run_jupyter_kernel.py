@@ -0,0 +1,318 @@
+import os
+import tempfile
+from unittest import TestCase, IsolatedAsyncioTestCase
+from unittest.mock import patch, MagicMock, AsyncMock
+
+import src.run_jupyter_kernel
+from src.run_jupyter_kernel import (
+    KernelPool,
+    get_client,
+    get_messages,
+    close_client,
+    execute_on_kernels,
+    merge_messages,
+    get_context,
+    DEFAULT_PRELOAD
+)
+
+
+class OtherKernel:
+    pass
+
+
+def fake_process(connection_file, kernel_class, **kwargs):
+    process = MagicMock()
+    process.connection_file = connection_file
+    process.kernel_class = kernel_class
+    return process
+
+
+@patch.object(src.run_jupyter_kernel, "wait_connection_file")
+@patch.object(
+    src.run_jupyter_kernel,
+    "IPKernelAppProcess",
+    side_effect=fake_process
+)
+class TestKernelPool(TestCase):
+    def test_acquire_idle(self, process: MagicMock, wait: MagicMock):
+        """
+        Kernel started by `warm` is returned and new idle kernel is started.
+        """
+        with KernelPool(size=1) as pool:
+            pool.warm()
+            idle = process.call_args.kwargs["connection_file"]
+
+            connection_file = pool.acquire()
+
+            self.assertEqual(connection_file, idle)
+            self.assertEqual(process.call_count, 2)
+            self.assertEqual(len(pool), 2)
+            wait.assert_called_once_with(idle, timeout=60)
+
+    def test_kernel_classes(self, process: MagicMock, wait: MagicMock):
+        """
+        Idle kernels are kept for each kernel class separately.
+        """
+        with KernelPool(size=1) as pool:
+            pool.warm()
+            pool.acquire(kernel_class=OtherKernel)
+            classes = [
+                call.kwargs["kernel_class"] for call in process.mock_calls
+                if "kernel_class" in call.kwargs
+            ]
+            self.assertEqual(classes[1:], [OtherKernel, OtherKernel])
+
+    def test_release_restart(self, process: MagicMock, wait: MagicMock):
+        with KernelPool(size=1) as pool:
+            connection_file = pool.acquire()
+            kernel = pool._busy[connection_file]
+
+            pool.release(connection_file)
+
+            kernel.terminate.assert_called_once()
+            self.assertEqual(len(pool), 1)
+
+    def test_release_reuse(self, process: MagicMock, wait: MagicMock):
+        with KernelPool(size=0) as pool:
+            connection_file = pool.acquire()
+            pool.release(connection_file, restart=False)
+            self.assertEqual(pool.acquire(), connection_file)
+            self.assertEqual(process.call_count, 1)
+
+    def test_max_kernels(self, process: MagicMock, wait: MagicMock):
+        """
+        The least recently used idle kernel is stopped for the new one, if
+        all kernels are in use the error is raised.
+        """
+        with KernelPool(size=0, max_kernels=2) as pool:
+            first = pool.acquire()
+            second = pool.acquire()
+            with self.assertRaises(RuntimeError):
+                pool.acquire()
+
+            pool.release(first, restart=False)
+            pool.release(second, restart=False)
+            first_kernel = pool._idle[first][0]
+
+            pool.acquire(kernel_class=OtherKernel)
+
+            first_kernel.terminate.assert_called_once()
+            self.assertIn(second, pool._idle)
+
+    def test_idle_timeout(self, process: MagicMock, wait: MagicMock):
+        with KernelPool(size=1, idle_timeout=0) as pool:
+            pool.warm()
+            kernel = next(iter(pool._idle.values()))[0]
+            pool.prune()
+            kernel.terminate.assert_called_once()
+            self.assertEqual(len(pool), 0)
+
+
+class TestGetContext(TestCase):
+    @patch.object(src.run_jupyter_kernel.multiprocessing, "get_context")
+    def test_forkserver_preload(self, get_mp_context: MagicMock):
+        get_context(start_method="forkserver")
+        get_mp_context.return_value.set_forkserver_preload \
+            .assert_called_once_with(DEFAULT_PRELOAD)
+
+        get_context(start_method="forkserver", preload=["zmq"])
+        get_mp_context.return_value.set_forkserver_preload \
+            .assert_called_with(["zmq"])
+
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            get_context(start_method="fork")
+
+    @patch.object(
+        src.run_jupyter_kernel,
+        "IPKernelAppProcess",
+        side_effect=fake_process
+    )
+    def test_pool_start_method(self, process: MagicMock):
+        with KernelPool(size=1, start_method="forkserver") as pool:
+            pool.warm()
+        self.assertEqual(
+            process.call_args.kwargs["start_method"],
+            "forkserver"
+        )
+
+
+def message(msg_id: str, msg_type: str, **content) -> dict:
+    return {
+        "parent_header": {"msg_id": msg_id},
+        "msg_type": msg_type,
+        "content": content
+    }
+
+
+@patch.object(src.run_jupyter_kernel, "BlockingKernelClient")
+class TestGetMessages(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.connection_file = os.path.join(self.tmpdir.name, "kernel.json")
+        with open(self.connection_file, "w") as f:
+            f.write('{"shell_port": 1}')
+
+    def tearDown(self):
+        close_client(self.connection_file)
+        self.tmpdir.cleanup()
+
+    def test_until_idle(self, client_class: MagicMock):
+        """
+        Only messages of the execution are collected, collection stops on the
+        idle status, the client is reused.
+        """
+        client = client_class.return_value
+        client.get_shell_msg.side_effect = src.run_jupyter_kernel.Empty
+        client.execute.side_effect = ["first", "second"]
+        client.get_iopub_msg.side_effect = [
+            message("other", "stream", text="stale"),
+            message("first", "status", execution_state="busy"),
+            message("first", "stream", text="1"),
+            message("first", "status", execution_state="idle"),
+            message("second", "status", execution_state="idle"),
+        ]
+
+        first = get_messages(
+            connection_file=self.connection_file, code="print(1)"
+        )
+        second = get_messages(
+            connection_file=self.connection_file, code="pass"
+        )
+
+        self.assertEqual(
+            [msg["msg_type"] for msg in first],
+            ["status", "stream", "status"]
+        )
+        self.assertEqual(len(second), 1)
+        client_class.assert_called_once()
+        client.load_connection_file.assert_called_once_with(
+            self.connection_file
+        )
+
+    def test_timeout(self, client_class: MagicMock):
+        client = client_class.return_value
+        client.get_shell_msg.side_effect = src.run_jupyter_kernel.Empty
+        client.execute.return_value = "id"
+        client.get_iopub_msg.side_effect = src.run_jupyter_kernel.Empty
+        with self.assertRaises(TimeoutError):
+            get_messages(
+                connection_file=self.connection_file, code="", timeout=0
+            )
+
+    def test_changed_connection_file(self, client_class: MagicMock):
+        """
+        Client is created again when the connection file is rewritten.
+        """
+        client_class.side_effect = lambda: MagicMock()
+        first = get_client(self.connection_file)
+        self.assertIs(get_client(self.connection_file), first)
+
+        with open(self.connection_file, "w") as f:
+            f.write('{"shell_port": 12}')
+        second = get_client(self.connection_file)
+
+        self.assertIsNot(second, first)
+        first.stop_channels.assert_called_once()
+        second.stop_channels.assert_not_called()
+
+    def test_drain_shell(self, client_class: MagicMock):
+        """
+        Replies to the previous executions are discarded before the new one.
+        """
+        client = client_class.return_value
+        client.get_shell_msg.side_effect = [
+            message("old", "execute_reply"),
+            message("older", "execute_reply"),
+            src.run_jupyter_kernel.Empty,
+        ]
+        client.execute.return_value = "id"
+        client.get_iopub_msg.side_effect = [
+            message("id", "status", execution_state="idle")
+        ]
+        get_messages(connection_file=self.connection_file, code="")
+        self.assertEqual(client.get_shell_msg.call_count, 3)
+
+
+def fake_async_client(outputs: dict[str, list[str]]):
+    """
+    Creates fake `AsyncKernelClient` class. Each client prints given outputs
+    for the connection file.
+    """
+    def create():
+        client = MagicMock()
+        client.wait_for_ready = AsyncMock()
+        client.execute.return_value = "id"
+
+        def load(connection_file):
+            messages = [message("other", "status", execution_state="idle")]
+            messages += [
+                message("id", "stream", text=text)
+                for text in outputs[connection_file]
+            ]
+            messages.append(message("id", "status", execution_state="idle"))
+            client.get_iopub_msg = AsyncMock(side_effect=messages)
+
+        client.load_connection_file.side_effect = load
+        return client
+    return create
+
+
+class TestAsyncExecution(IsolatedAsyncioTestCase):
+    async def test_execute_on_kernels(self):
+        with patch.object(
+            src.run_jupyter_kernel,
+            "AsyncKernelClient",
+            side_effect=fake_async_client({"a": ["1"], "b": ["2", "3"]})
+        ):
+            out = await execute_on_kernels(["a", "b"], code=["x", "y"])
+        self.assertEqual(
+            [[msg["msg_type"] for msg in messages] for messages in out],
+            [["stream", "status"], ["stream", "stream", "status"]]
+        )
+
+    async def test_timeout(self):
+        """
+        Failed execution on one kernel doesn't affect the others.
+        """
+        def create():
+            client = fake_async_client({"a": ["1"]})()
+            if not create.clients:
+                client.get_iopub_msg = AsyncMock(
+                    side_effect=src.run_jupyter_kernel.Empty
+                )
+                client.load_connection_file.side_effect = None
+            create.clients.append(client)
+            return client
+        create.clients = []
+
+        with patch.object(
+            src.run_jupyter_kernel,
+            "AsyncKernelClient",
+            side_effect=create
+        ):
+            out = await execute_on_kernels(["a", "a"], code="x", timeout=0)
+        self.assertIsInstance(out[0], TimeoutError)
+        self.assertEqual(len(out[1]), 2)
+        for client in create.clients:
+            client.stop_channels.assert_called_once()
+
+    async def test_merge_messages(self):
+        with patch.object(
+            src.run_jupyter_kernel,
+            "AsyncKernelClient",
+            side_effect=fake_async_client({"a": ["1"], "b": ["2"]})
+        ):
+            out = [
+                (connection_file, msg["msg_type"])
+                async for connection_file, msg in merge_messages(
+                    ["a", "b"], code="x"
+                )
+            ]
+        self.assertEqual(
+            sorted(out),
+            [
+                ("a", "status"), ("a", "stream"),
+                ("b", "status"), ("b", "stream")
+            ]
+        )
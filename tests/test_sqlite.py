@@ -1,8 +1,23 @@
-from unittest import TestCase
+import io
+import os
+import importlib.util
+import sqlite3
+import tempfile
+from unittest import TestCase, skipUnless
 from unittest.mock import patch, MagicMock
 
 import src.sqlite
-from src.sqlite import split_sql_statement, execute_several_statements
+from src.sqlite import (
+    iter_sql_statements,
+    split_sql_statement,
+    execute_several_statements,
+    iter_several_statements,
+    apply_pragmas,
+    BULK_PRAGMAS,
+    StatementsCache,
+    ConnectionPool,
+    fetch_columns
+)
 
 
 class TestSplitStatement(TestCase):
@@ -19,6 +34,94 @@ class TestSplitStatement(TestCase):
         ]
         self.assertEqual(out, exp_out)
 
+    def test_literals_and_comments(self):
+        """
+        Semicolons inside literals, quoted identifiers and comments don't
+        split the statement. Empty and comment only fragments are skipped.
+        """
+        inp = (
+            "SELECT 'a;b', \"c;\", [d;e] -- f;\n;"
+            " /* g; */ SELECT 1 - 2/3; ;; -- the end"
+        )
+        exp_out = [
+            "SELECT 'a;b', \"c;\", [d;e] -- f;",
+            "/* g; */ SELECT 1 - 2/3"
+        ]
+        self.assertEqual(split_sql_statement(inp), exp_out)
+
+    def test_trigger(self):
+        """
+        Body of the trigger is a part of the `CREATE TRIGGER` statement.
+        """
+        trigger = (
+            "CREATE TRIGGER tr AFTER INSERT ON t BEGIN "
+            "INSERT INTO log VALUES (1); DELETE FROM t; END"
+        )
+        out = split_sql_statement(f"CREATE TABLE t(a); {trigger}; SELECT 1;")
+        self.assertEqual(out, ["CREATE TABLE t(a)", trigger, "SELECT 1"])
+
+
+class TestIterSqlStatements(TestCase):
+    def test_stream_chunks(self):
+        """
+        Splitting the stream must not depend on the chunk borders.
+        """
+        code = (
+            "SELECT 'x;' /* a;*/; -- b\nSELECT 2 - 1;"
+            "SELECT \"y\" / 2"
+        )
+        exp_out = list(iter_sql_statements(code))
+        for chunk_size in range(1, 8):
+            out = list(
+                iter_sql_statements(io.StringIO(code), chunk_size=chunk_size)
+            )
+            self.assertEqual(out, exp_out)
+
+    def test_trigger_chunks(self):
+        """
+        Trigger bodies are kept together for any chunk borders, with
+        comments after `END` and `CASE ... END` inside the body.
+        """
+        trigger = (
+            "CREATE TEMP /* c */ TRIGGER tr AFTER INSERT ON t BEGIN "
+            "INSERT INTO log VALUES (CASE WHEN 1 THEN 2 END); "
+            "INSERT INTO log VALUES ('END;'); END -- end\n"
+        )
+        code = trigger + "; SELECT 1;"
+        exp_out = [trigger.strip(), "SELECT 1"]
+        self.assertEqual(list(iter_sql_statements(code)), exp_out)
+        for chunk_size in range(1, 8):
+            out = list(
+                iter_sql_statements(io.StringIO(code), chunk_size=chunk_size)
+            )
+            self.assertEqual(out, exp_out)
+
+    def test_large_trigger(self):
+        """
+        The completeness of the trigger is checked only after `END`, not on
+        each statement of its body.
+        """
+        body = "".join(
+            f"INSERT INTO log VALUES ({i});" for i in range(1000)
+        )
+        trigger = f"CREATE TRIGGER tr AFTER INSERT ON t BEGIN {body} END"
+        with patch.object(
+            src.sqlite.sqlite3, "complete_statement",
+            wraps=sqlite3.complete_statement
+        ) as complete_statement:
+            out = list(iter_sql_statements(trigger + "; SELECT 1;"))
+        self.assertEqual(out, [trigger, "SELECT 1"])
+        self.assertEqual(complete_statement.call_count, 2)
+
+    def test_lazy(self):
+        """
+        Statements are produced before the whole stream is read.
+        """
+        stream = io.StringIO("SELECT 1;" + "SELECT 2;" * 1000)
+        statements = iter_sql_statements(stream, chunk_size=16)
+        self.assertEqual(next(statements), "SELECT 1")
+        self.assertLess(stream.tell(), 100)
+
 
 class TestExecuteSeveralStatements(TestCase):
 
@@ -59,3 +162,425 @@ class TestExecuteSeveralStatements(TestCase):
         execute_several_statements(cursor=cursor, queries=queries)
 
         self.assert_cursor_state(cursor=cursor, queries=queries)
+
+    def test_stream_input(self):
+        """
+        Case when function takes a text stream as input.
+        """
+        cursor = sqlite3.connect(":memory:").cursor()
+        stream = io.StringIO(
+            "CREATE TABLE t(a); INSERT INTO t VALUES ('x;y'); SELECT a FROM t;"
+        )
+        out = execute_several_statements(cursor=cursor, queries=stream)
+        self.assertEqual(len(out), 3)
+        self.assertEqual(out[2][1], [("x;y",)])
+
+
+class TestIterSeveralStatements(TestCase):
+    def setUp(self):
+        self.cursor = sqlite3.connect(":memory:").cursor()
+        self.cursor.execute("CREATE TABLE t(a)")
+        self.cursor.executemany(
+            "INSERT INTO t VALUES (?)", [(i,) for i in range(5)]
+        )
+
+    def test_batches(self):
+        """
+        Rows are returned in batches of the given size, statements without
+        output produce no batches.
+        """
+        out = [
+            (description, list(batches))
+            for description, batches in iter_several_statements(
+                cursor=self.cursor,
+                queries="SELECT a FROM t; DELETE FROM t;",
+                batch_size=2
+            )
+        ]
+        self.assertEqual(out[0][0][0][0], "a")
+        self.assertEqual(out[0][1], [[(0,), (1,)], [(2,), (3,)], [(4,)]])
+        self.assertEqual(out[1], (None, []))
+
+    def test_lazy(self):
+        """
+        Next statement is executed only when it's requested and rows of the
+        previous statement are no longer available.
+        """
+        statements = iter_several_statements(
+            cursor=self.cursor,
+            queries=["SELECT a FROM t", "DELETE FROM t"],
+            batch_size=1
+        )
+        _, batches = next(statements)
+        self.assertEqual(next(batches), [(0,)])
+        self.assertEqual(
+            self.cursor.connection.execute(
+                "SELECT COUNT(*) FROM t"
+            ).fetchone(),
+            (5,)
+        )
+        next(statements)
+        self.assertEqual(list(batches), [])
+
+
+class TestBulkMode(TestCase):
+    script = (
+        "CREATE TABLE t(a, b);"
+        "INSERT INTO t VALUES (1, 'it''s');"
+        "INSERT INTO t VALUES (-2.5, NULL);"
+        "INSERT INTO t VALUES (X'0102', 3);"
+        "SELECT COUNT(*) FROM t;"
+        "INSERT INTO t (a, b) VALUES (4, 5);"
+        "INSERT INTO t VALUES (abs(-6), 7);"
+        "INSERT INTO t VALUES (8, 9);"
+        "SELECT * FROM t;"
+    )
+
+    def run_script(self, bulk: bool) -> tuple[list, list]:
+        connection = sqlite3.connect(":memory:", isolation_level=None)
+        cursor = connection.cursor()
+        out = execute_several_statements(
+            cursor=cursor,
+            queries=self.script,
+            bulk=bulk
+        )
+        self.assertFalse(connection.in_transaction)
+        return out, cursor.execute("SELECT * FROM t").fetchall()
+
+    def test_same_output(self):
+        """
+        Bulk mode must produce the same results as regular mode.
+        """
+        self.assertEqual(
+            self.run_script(bulk=True),
+            self.run_script(bulk=False)
+        )
+
+    def test_one_transaction(self):
+        """
+        Statements of the script are executed in one transaction.
+        """
+        cursor = MagicMock()
+        cursor.connection.in_transaction = False
+
+        def execute(query: str) -> None:
+            if query == "BEGIN":
+                cursor.connection.in_transaction = True
+            elif query == "COMMIT":
+                cursor.connection.in_transaction = False
+
+        cursor.execute.side_effect = execute
+        execute_several_statements(
+            cursor=cursor,
+            queries=self.script,
+            bulk=True
+        )
+        queries = [call.args[0] for call in cursor.execute.call_args_list]
+        self.assertEqual(queries[0], "BEGIN")
+        self.assertEqual(queries[-1], "COMMIT")
+        self.assertEqual(queries.count("BEGIN"), 1)
+        self.assertEqual(len(queries), 11)
+
+    def test_script_transactions(self):
+        """
+        Transaction control statements of the script are respected.
+        """
+        connection = sqlite3.connect(":memory:")
+        cursor = connection.cursor()
+        execute_several_statements(
+            cursor=cursor,
+            queries=(
+                "CREATE TABLE t(a); INSERT INTO t VALUES (1); COMMIT;"
+                "BEGIN; INSERT INTO t VALUES (2); ROLLBACK;"
+                "INSERT INTO t VALUES (3);"
+            ),
+            bulk=True
+        )
+        self.assertFalse(connection.in_transaction)
+        self.assertEqual(
+            cursor.execute("SELECT a FROM t").fetchall(),
+            [(1,), (3,)]
+        )
+
+    def test_rollback_on_error(self):
+        connection = sqlite3.connect(":memory:")
+        cursor = connection.cursor()
+        cursor.execute("CREATE TABLE t(a)")
+        connection.commit()
+        with self.assertRaises(sqlite3.OperationalError):
+            execute_several_statements(
+                cursor=cursor,
+                queries="INSERT INTO t VALUES (1); INSERT INTO no VALUES (2)",
+                bulk=True
+            )
+        self.assertEqual(cursor.execute("SELECT * FROM t").fetchall(), [])
+
+
+class TestApplyPragmas(TestCase):
+    def test_bulk_pragmas(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            connection = sqlite3.connect(os.path.join(tmpdir, "test.db"))
+            cursor = connection.cursor()
+            apply_pragmas(cursor=cursor, pragmas=BULK_PRAGMAS)
+            self.assertEqual(
+                cursor.execute("PRAGMA journal_mode").fetchone(),
+                ("wal",)
+            )
+            connection.close()
+
+    def test_invalid_pragma(self):
+        cursor = MagicMock()
+        with self.assertRaises(ValueError):
+            apply_pragmas(cursor=cursor, pragmas={"a; DROP TABLE t": 1})
+        cursor.execute.assert_not_called()
+
+
+class TestStatementsCache(TestCase):
+    @patch.object(src.sqlite, "split_sql_statement")
+    def test_hits_misses(self, split_function: MagicMock):
+        """
+        Script is split only once, the same statements are returned for the
+        repeated script.
+        """
+        split_function.return_value = ["SELECT 1", "SELECT 2"]
+        cache = StatementsCache()
+
+        first = cache.split("SELECT 1; SELECT 2;")
+        second = cache.split("SELECT 1; SELECT 2;")
+
+        split_function.assert_called_once_with(code="SELECT 1; SELECT 2;")
+        self.assertIs(first, second)
+        self.assertEqual(first, ("SELECT 1", "SELECT 2"))
+        info = cache.info()
+        self.assertEqual((info.hits, info.misses, info.currsize), (1, 1, 1))
+
+    def test_lru_eviction(self):
+        """
+        The least recently used script is dropped when the size is exceeded.
+        """
+        cache = StatementsCache(maxsize=2)
+        cache.split("SELECT 1")
+        cache.split("SELECT 2")
+        cache.split("SELECT 1")
+        cache.split("SELECT 3")
+        self.assertEqual(cache.info().currsize, 2)
+
+        cache.split("SELECT 1")
+        self.assertEqual(cache.info().misses, 3)
+        cache.split("SELECT 2")
+        self.assertEqual(cache.info().misses, 4)
+
+        cache.clear()
+        self.assertEqual(tuple(cache.info()), (0, 0, 2, 0))
+
+    def test_execute(self):
+        cache = StatementsCache()
+        cursor = sqlite3.connect(":memory:").cursor()
+        for _ in range(3):
+            out = execute_several_statements(
+                cursor=cursor,
+                queries="SELECT 1; SELECT 2;",
+                cache=cache
+            )
+            self.assertEqual([rows for _, rows in out], [[(1,)], [(2,)]])
+        self.assertEqual(cache.info().hits, 2)
+
+
+class TestConnectionPool(TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.pool = ConnectionPool(
+            database=os.path.join(self._tmpdir.name, "test.db"),
+            readers=3
+        )
+
+    def tearDown(self):
+        self.pool.close()
+        self._tmpdir.cleanup()
+
+    def test_order(self):
+        """
+        Results are returned in the order of the statements and reads see
+        the results of the previous writes.
+        """
+        out = self.pool.execute_several_statements(
+            "CREATE TABLE t(a);"
+            "SELECT COUNT(*) FROM t;"
+            "INSERT INTO t VALUES (1), (2);"
+            "SELECT COUNT(*) FROM t;"
+            "SELECT 10;"
+            "WITH x AS (SELECT 3) INSERT INTO t SELECT * FROM x;"
+            "WITH x AS (SELECT SUM(a) FROM t) SELECT * FROM x;"
+        )
+        self.assertEqual(
+            [rows for _, rows in out],
+            [[], [(0,)], [], [(2,)], [(10,)], [], [(6,)]]
+        )
+
+    def test_transaction(self):
+        """
+        Reads inside the transaction see its uncommitted changes.
+        """
+        out = self.pool.execute_several_statements(
+            "CREATE TABLE t(a);"
+            "BEGIN;"
+            "INSERT INTO t VALUES (1);"
+            "SELECT COUNT(*) FROM t;"
+            "COMMIT;"
+            "SELECT COUNT(*) FROM t;"
+        )
+        self.assertEqual(
+            [rows for _, rows in out],
+            [[], [], [], [(1,)], [], [(1,)]]
+        )
+
+    def test_connection_functions(self):
+        """
+        Functions that return the state of the connection are executed on the
+        writer.
+        """
+        out = self.pool.execute_several_statements(
+            "CREATE TABLE t(a);"
+            "INSERT INTO t VALUES (1), (2);"
+            "SELECT last_insert_rowid(), changes(), total_changes();"
+        )
+        self.assertEqual(out[-1][1], [(2, 2, 2)])
+
+    def test_temp_objects(self):
+        """
+        TEMP objects are visible to the following reads and calls.
+        """
+        out = self.pool.execute_several_statements(
+            "CREATE TEMP TABLE t AS SELECT 1 a; SELECT * FROM t;"
+        )
+        self.assertEqual(out[-1][1], [(1,)])
+        out = self.pool.execute_several_statements("SELECT * FROM temp.t;")
+        self.assertEqual(out[-1][1], [(1,)])
+
+    def test_attach(self):
+        other = os.path.join(self._tmpdir.name, "other.db")
+        out = self.pool.execute_several_statements(
+            f"ATTACH DATABASE '{other}' AS other;"
+            "CREATE TABLE other.t(a);"
+            "INSERT INTO other.t VALUES (1);"
+            "SELECT * FROM other.t;"
+        )
+        self.assertEqual(out[-1][1], [(1,)])
+
+    def test_failed_transaction(self):
+        """
+        Transaction left open by the failed script is rolled back.
+        """
+        self.pool.execute_several_statements("CREATE TABLE t(a);")
+        with self.assertRaises(sqlite3.OperationalError):
+            self.pool.execute_several_statements(
+                "BEGIN; INSERT INTO t VALUES (1); INSERT INTO no VALUES (2);"
+            )
+        self.assertFalse(self.pool.writer.in_transaction)
+        out = self.pool.execute_several_statements("SELECT COUNT(*) FROM t;")
+        self.assertEqual(out[0][1], [(0,)])
+
+    def test_readers_are_read_only(self):
+        self.pool.execute_several_statements("CREATE TABLE t(a);")
+        with self.assertRaises(sqlite3.OperationalError):
+            self.pool._read("INSERT INTO t VALUES (1)")
+
+    def test_memory_database(self):
+        with self.assertRaises(ValueError):
+            ConnectionPool(database=":memory:")
+
+
+class TestFetchColumns(TestCase):
+    query = (
+        "SELECT 1 a, 1 b, 1.5 c, 'x' d, NULL e, 1 a "
+        "UNION ALL SELECT 2, NULL, 2, X'01', NULL, 2 "
+        "UNION ALL SELECT 3, 3, 3.5, 'z', NULL, 3"
+    )
+
+    def setUp(self):
+        self.cursor = sqlite3.connect(":memory:").cursor()
+
+    def test_numpy(self):
+        """
+        Types of the columns are promoted across the batches.
+        """
+        import numpy as np
+
+        self.cursor.execute(self.query)
+        out = fetch_columns(cursor=self.cursor, columnar="numpy", batch_size=1)
+
+        self.assertEqual(list(out), ["a", "b", "c", "d", "e", "a.1"])
+        self.assertEqual(out["a"].dtype, np.int64)
+        self.assertEqual(out["a"].tolist(), [1, 2, 3])
+        self.assertEqual(out["b"].dtype, np.float64)
+        self.assertTrue(np.isnan(out["b"][1]))
+        self.assertEqual(out["c"].tolist(), [1.5, 2.0, 3.5])
+        self.assertEqual(out["d"].tolist(), ["x", b"\x01", "z"])
+        self.assertEqual(out["e"].shape, (3,))
+
+    def test_batch_size(self):
+        """
+        Result doesn't depend on the batch in which the column becomes object:
+        NULLs and integers keep their values.
+        """
+        query = (
+            "SELECT NULL a UNION ALL SELECT 5 UNION ALL SELECT 2.5 "
+            "UNION ALL SELECT 9007199254740993 UNION ALL SELECT 'x'"
+        )
+        outputs = []
+        for batch_size in (1, 2, 10):
+            self.cursor.execute(query)
+            out = fetch_columns(cursor=self.cursor, batch_size=batch_size)
+            outputs.append([(type(x), x) for x in out["a"].tolist()])
+        self.assertEqual(outputs[0], [
+            (type(None), None), (int, 5), (float, 2.5),
+            (int, 9007199254740993), (str, "x")
+        ])
+        self.assertEqual(outputs[1], outputs[0])
+        self.assertEqual(outputs[2], outputs[0])
+
+    def test_empty(self):
+        self.cursor.execute("SELECT 1 a WHERE 0")
+        out = fetch_columns(cursor=self.cursor)
+        self.assertEqual(out["a"].shape, (0,))
+
+    @skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is required")
+    def test_arrow(self):
+        self.cursor.execute("SELECT 1 a, NULL b UNION ALL SELECT 2, 'y'")
+        out = fetch_columns(cursor=self.cursor, columnar="arrow", batch_size=1)
+        self.assertEqual(out.to_pydict(), {"a": [1, 2], "b": [None, "y"]})
+
+    @skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is required")
+    def test_arrow_mixed_types(self):
+        """
+        Column with integers and text raises the error with its name, in one
+        batch and across the batches.
+        """
+        for batch_size in (1, 10):
+            self.cursor.execute("SELECT 1 a, 1 b UNION ALL SELECT 2, 'y'")
+            with self.assertRaisesRegex(ValueError, "'b'"):
+                fetch_columns(
+                    cursor=self.cursor,
+                    columnar="arrow",
+                    batch_size=batch_size
+                )
+
+    def test_execute(self):
+        """
+        Statements that don't return data keep the regular output.
+        """
+        out = execute_several_statements(
+            cursor=self.cursor,
+            queries=(
+                "CREATE TABLE t(a); INSERT INTO t VALUES (1); SELECT a FROM t;"
+            ),
+            bulk=True,
+            columnar="numpy"
+        )
+        self.assertEqual(out[1], (None, []))
+        self.assertEqual(out[2][1]["a"].tolist(), [1])
+
+    def test_unknown_format(self):
+        self.cursor.execute("SELECT 1")
+        with self.assertRaises(ValueError):
+            fetch_columns(cursor=self.cursor, columnar="csv")
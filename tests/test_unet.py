@@ -0,0 +1,239 @@
+import copy
+import importlib.util
+from pathlib import Path
+from unittest import TestCase, skipUnless
+
+HAS_TORCH = all(
+    importlib.util.find_spec(name)
+    for name in ("torch", "tqdm", "huggingface_hub")
+)
+
+if HAS_TORCH:
+    import torch
+    import numpy as np
+    from torch import nn
+
+    # The UNet example is not a package, it's loaded from its file.
+    spec = importlib.util.spec_from_file_location(
+        "unet",
+        Path(__file__).parents[1] / "torch" / "examples" / "unet" / "unet.py"
+    )
+    unet = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(unet)
+
+    class SmallUNet(nn.Module):
+        def __init__(self, n_channels: int = 3, n_classes: int = 4):
+            super().__init__()
+            self.inc = unet.DoubleConv(n_channels, out_channels=8)
+            self.down1 = unet.Down(in_channels=8, out_channels=16)
+            self.down2 = unet.Down(in_channels=16, out_channels=16)
+            self.up1 = unet.Up(in_channels=32, out_channels=8)
+            self.up2 = unet.Up(in_channels=16, out_channels=8)
+            self.outc = nn.Conv2d(8, n_classes, kernel_size=1)
+
+        def forward(self, x: torch.Tensor) -> torch.Tensor:
+            x1 = self.inc(x)
+            x2 = self.down1(x1)
+            x3 = self.down2(x2)
+            x = self.up1(x3, x_left=x2)
+            x = self.up2(x, x_left=x1)
+            return self.outc(x)
+
+
+@skipUnless(HAS_TORCH, "torch is required")
+class TestFastPath(TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = SmallUNet().eval()
+        self.X = torch.randn(2, 3, 20, 20)
+
+    def run_fast_path(self, fast_path: "unet.FastPath") -> torch.Tensor:
+        model = fast_path.prepare(self.model)
+        with torch.inference_mode(), fast_path.autocast("cpu"):
+            return model(fast_path.input(self.X)).float()
+
+    def test_disabled(self):
+        """
+        Disabled and default fast paths give the output of the plain model.
+        """
+        with torch.inference_mode():
+            expected = self.model(self.X)
+        for fast_path in (
+            unet.FastPath(),
+            unet.FastPath(bf16=True, channels_last=True, enabled=False)
+        ):
+            with self.subTest(fast_path=fast_path):
+                self.assertTrue(
+                    torch.equal(self.run_fast_path(fast_path), expected)
+                )
+
+    def test_channels_last(self):
+        with torch.inference_mode():
+            expected = self.model(self.X)
+        out = self.run_fast_path(unet.FastPath(channels_last=True))
+        torch.testing.assert_close(out, expected)
+
+
+@skipUnless(HAS_TORCH, "torch is required")
+class TestMetricsAccumulator(TestCase):
+    ignore_index = 255
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.batches = []
+        for _ in range(3):
+            logits = torch.randn(2, 4, 5, 6)
+            # The last class is neither predicted nor in the targets.
+            logits[:, 3] = -10
+            target = torch.randint(0, 3, (2, 5, 6))
+            target[torch.rand(target.shape) < 0.2] = self.ignore_index
+            self.batches.append((logits, target))
+
+    def test_metrics(self):
+        """
+        Accumulated metrics are equal to the ones computed on all pixels at
+        once, ignored pixels are not in the confusion matrix.
+        """
+        metrics = unet.MetricsAccumulator()
+        for logits, target in self.batches:
+            metrics.update(predict=logits, target=target)
+        out = metrics.compute()
+
+        labels = torch.cat([
+            logits.argmax(dim=1) for logits, _ in self.batches
+        ])
+        target = torch.cat([target for _, target in self.batches])
+        valid = target != self.ignore_index
+        self.assertAlmostEqual(
+            out["accuracy"],
+            ((labels == target).sum() / target.numel()).item()
+        )
+        self.assertEqual(out["confusion"].sum().item(), valid.sum().item())
+
+        iou = []
+        for c in range(4):
+            intersection = ((labels == c) & (target == c) & valid).sum()
+            union = (((labels == c) | (target == c)) & valid).sum()
+            iou.append(intersection / union)
+        iou = torch.stack(iou)
+        torch.testing.assert_close(out["iou"], iou, equal_nan=True)
+        self.assertTrue(out["iou"][3].isnan())
+        self.assertAlmostEqual(out["mean_iou"], iou.nanmean().item())
+
+    def test_evaluate(self):
+        """
+        `evaluate` keeps the pixel accuracy and the average loss over the
+        batches.
+        """
+        loss_fun = nn.CrossEntropyLoss(ignore_index=self.ignore_index)
+        accuracy, loss = unet.evaluate(
+            model=nn.Identity(),
+            loader=self.batches,
+            loss_fun=loss_fun
+        )
+
+        correct = sum(
+            (logits.argmax(dim=1) == target).sum().item()
+            for logits, target in self.batches
+        )
+        total = sum(target.numel() for _, target in self.batches)
+        self.assertAlmostEqual(accuracy, correct / total)
+        self.assertAlmostEqual(loss, sum(
+            loss_fun(input=logits, target=target).item()
+            for logits, target in self.batches
+        ) / len(self.batches), places=5)
+
+
+@skipUnless(HAS_TORCH, "torch is required")
+class TestRunEpoch(TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.X = torch.randn(7, 3, 12, 12)
+        self.y = torch.randint(0, 4, (7, 12, 12))
+
+    def fit(self, model: "nn.Module", **kwargs) -> "nn.Module":
+        optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+        unet.run_epoch(
+            model=model,
+            loader=[(self.X, self.y)],
+            loss_fun=nn.functional.cross_entropy,
+            optimizer=optimizer,
+            **kwargs
+        )
+        return model
+
+    def test_accumulation(self):
+        """
+        Gradients accumulated over the micro-batches, including the smaller
+        last one, are the gradients of the whole batch.
+        """
+        model = nn.Sequential(
+            nn.Conv2d(3, 8, kernel_size=3, padding=1),
+            nn.ReLU(),
+            nn.Conv2d(8, 4, kernel_size=1)
+        )
+        full = self.fit(copy.deepcopy(model))
+        accumulated = self.fit(copy.deepcopy(model), accumulation_steps=3)
+        for expected, parameter in zip(
+            full.parameters(), accumulated.parameters()
+        ):
+            torch.testing.assert_close(parameter.grad, expected.grad)
+
+    def test_checkpointing(self):
+        """
+        Checkpointing gives the same gradients and updates the running
+        statistics of the batch norm layers once.
+        """
+        model = SmallUNet()
+        plain = self.fit(copy.deepcopy(model), checkpointing=False)
+        checkpointed = self.fit(copy.deepcopy(model), checkpointing=True)
+        self.assertTrue(checkpointed.down1.checkpointing)
+        for name, expected in plain.state_dict().items():
+            torch.testing.assert_close(
+                checkpointed.state_dict()[name], expected, msg=name
+            )
+
+        # Checkpointing of the model is kept by default.
+        self.fit(checkpointed)
+        self.assertTrue(checkpointed.down1.checkpointing)
+
+
+@skipUnless(HAS_TORCH, "torch is required")
+class TestPredictTiled(TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        # Each pixel of the output depends only on the same pixel of the
+        # input, so the tiles must give the output of the whole image.
+        self.model = nn.Conv2d(3, 2, kernel_size=1)
+
+    def check(self, image: "np.ndarray", **kwargs) -> None:
+        with torch.inference_mode():
+            expected = self.model(torch.from_numpy(image)[None])[0].numpy()
+        out = unet.predict_tiled(
+            self.model, image, tile_size=16, overlap=4, batch_size=3,
+            **kwargs
+        )
+        np.testing.assert_allclose(out, expected, rtol=1e-5, atol=1e-5)
+
+    def test_full_image(self):
+        for shape in ((3, 50, 70), (3, 40, 16), (3, 10, 9), (3, 10, 30)):
+            with self.subTest(shape=shape):
+                image = np.random.rand(*shape).astype(np.float32)
+                self.check(image)
+                self.check(image, num_workers=2)
+
+    def test_out(self):
+        image = np.random.rand(3, 20, 30).astype(np.float32)
+        out = np.full((2, 20, 30), np.nan, dtype=np.float32)
+        self.check(image, out=out)
+        self.assertFalse(np.isnan(out).any())
+
+        for out in (
+            np.zeros((2, 30, 20), dtype=np.float32),
+            np.zeros((20, 30), dtype=np.float32),
+            np.zeros((2, 20, 30), dtype=np.int64),
+            np.zeros((3, 20, 30), dtype=np.float32),
+        ):
+            with self.subTest(shape=out.shape, dtype=out.dtype):
+                with self.assertRaises(ValueError):
+                    unet.predict_tiled(self.model, image, out=out)
@@ -2,15 +2,25 @@
 Tools that is used for fitting evaluating and saving UNet models.
 '''
 
+import sys
+import copy
+import time
 import torch
+import numpy as np
 from torch import nn
 from torch.utils.data import DataLoader
+from torch.utils.checkpoint import checkpoint
 
 from tqdm import tqdm
 import huggingface_hub
 from pathlib import Path
-from typing import Callable
+from typing import Callable, Iterable, Iterator
+from collections import deque
+from weakref import WeakKeyDictionary
+from concurrent.futures import ThreadPoolExecutor
 from tempfile import TemporaryDirectory
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from dataclasses import dataclass, field
 
 class DoubleConv(nn.Module):
     '''
@@ -60,6 +70,50 @@ class DoubleConv(nn.Module):
         return self.double_conv(x)
 
 
+def _use_checkpoint(module: nn.Module) -> bool:
+    return (
+        module.checkpointing
+        and module.training
+        and torch.is_grad_enabled()
+    )
+
+
+@contextmanager
+def _frozen_batch_norm(module: nn.Module) -> Iterator[None]:
+    '''
+    Batch norm layers of the module don't change their running statistics:
+    momentum is zero and the counter of the batches is restored on exit.
+    '''
+    layers = [
+        (layer, layer.momentum, layer.num_batches_tracked.clone())
+        for layer in module.modules()
+        if isinstance(layer, nn.modules.batchnorm._BatchNorm)
+        and layer.track_running_stats
+    ]
+    for layer, _, _ in layers:
+        layer.momentum = 0.0
+    try:
+        yield
+    finally:
+        for layer, momentum, num_batches_tracked in layers:
+            layer.momentum = momentum
+            layer.num_batches_tracked.copy_(num_batches_tracked)
+
+
+def _checkpoint(module: nn.Module, function: Callable, *args) -> torch.Tensor:
+    '''
+    Checkpointed call of the function of the module. The recomputation in the
+    backward pass doesn't update the running statistics of the batch norm
+    layers, so they are updated once for each training step.
+    '''
+    return checkpoint(
+        function,
+        *args,
+        use_reentrant=False,
+        context_fn=lambda: (nullcontext(), _frozen_batch_norm(module))
+    )
+
+
 class Down(nn.Module):
     '''
     Downscaling block. Applies MaxPooling2D and double convolution. As a result,
@@ -72,7 +126,14 @@ class Down(nn.Module):
         Channels number of the input data.
     out_channesl: int
         Channels number of the output data.
+
+    Attributes
+    ----------
+    checkpointing: bool
+        Don't keep the activations of the block for the backward pass, they
+        are recomputed instead. See `set_checkpointing`.
     '''
+    checkpointing = False
 
     def __init__(self, in_channels: int, out_channels: int) -> None:
         super().__init__()
@@ -82,6 +143,8 @@ class Down(nn.Module):
         )
 
     def forward(self, x: torch.Tensor) -> torch.Tensor:
+        if _use_checkpoint(self):
+            return _checkpoint(self, self.maxpool_conv, x)
         return self.maxpool_conv(x)
 
 
@@ -98,7 +161,14 @@ class Up(nn.Module):
         Number of input channels.
     out_channels: int
         Number of output channels.
+
+    Attributes
+    ----------
+    checkpointing: bool
+        Don't keep the activations of the block for the backward pass, they
+        are recomputed instead. See `set_checkpointing`.
     '''
+    checkpointing = False
 
     def __init__(self, in_channels: int, out_channels: int) -> None:
         super().__init__()
@@ -114,6 +184,11 @@ class Up(nn.Module):
         )
 
     def forward(self, x: torch.Tensor, x_left: torch.Tensor) -> torch.Tensor:
+        if _use_checkpoint(self):
+            return _checkpoint(self, self._forward, x, x_left)
+        return self._forward(x, x_left)
+
+    def _forward(self, x: torch.Tensor, x_left: torch.Tensor) -> torch.Tensor:
         x = self.up(x)
 
         diffY = x_left.shape[2] - x.shape[2]
@@ -123,18 +198,236 @@ class Up(nn.Module):
         # Similarly with Y.
         pad = [diffX // 2, diffX - diffX // 2, diffY // 2, diffY - diffY // 2]
         x = torch.nn.functional.pad(input=x, pad=pad)
+        # Padding returns contiguous tensor, keep the format of the input.
+        if x_left.is_contiguous(memory_format=torch.channels_last):
+            x = x.contiguous(memory_format=torch.channels_last)
 
         x = torch.cat([x_left, x], dim=1)
 
         return self.conv(x)
-    
+
+
+def set_checkpointing(model: nn.Module, enabled: bool = True) -> None:
+    '''
+    Turn on or off the activation checkpointing for all `Down` and `Up`
+    blocks of the model. Checkpointed blocks run their forward pass again
+    during the backward pass, the running statistics of their batch norm
+    layers are not updated by this second pass.
+    '''
+    for module in model.modules():
+        if isinstance(module, (Down, Up)):
+            module.checkpointing = enabled
+
+
+def _reset_peak_memory(device: torch.device) -> None:
+    if device.type == "cuda":
+        torch.cuda.reset_peak_memory_stats(device)
+        return
+    try:
+        # Resets the peak resident set size of the process, Linux only.
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_memory(device: torch.device) -> int:
+    '''
+    Peak memory in bytes: allocated by torch for the CUDA devices, the
+    resident set size of the process otherwise.
+    '''
+    if device.type == "cuda":
+        return torch.cuda.max_memory_allocated(device)
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS - bytes.
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+@dataclass
+class FastPath:
+    '''
+    Options that speed up the model on CPU. The same object is passed to
+    `run_epoch` and `evaluate`, all options are disabled by default.
+
+    Parameters
+    ----------
+    bf16: bool
+        Run the forward pass under `torch.autocast` with bfloat16.
+    channels_last: bool
+        Keep the weights of the model and the inputs in the
+        `torch.channels_last` memory format, which is faster for the
+        convolutions of `DoubleConv`, `Down` and `Up` blocks.
+    compile: bool
+        Compile the model with `torch.compile`.
+    compile_mode: str|None
+        The `mode` argument of `torch.compile`.
+    enabled: bool
+        Apply the options, if False the model runs as it is regardless of
+        the other options.
+    '''
+    bf16: bool = False
+    channels_last: bool = False
+    compile: bool = False
+    compile_mode: str|None = None
+    enabled: bool = True
+    _compiled: WeakKeyDictionary = field(
+        default_factory=WeakKeyDictionary,
+        init=False,
+        repr=False,
+        compare=False
+    )
+
+    def prepare(self, model: nn.Module) -> nn.Module:
+        '''
+        Model to be called with the options applied. The model is converted
+        to `channels_last` in place, the compiled model is created once for
+        each model.
+        '''
+        if not self.enabled:
+            return model
+        if self.channels_last:
+            model.to(memory_format=torch.channels_last)
+        if not self.compile:
+            return model
+        if model not in self._compiled:
+            self._compiled[model] = torch.compile(
+                model,
+                mode=self.compile_mode
+            )
+        return self._compiled[model]
+
+    def input(self, X: torch.Tensor) -> torch.Tensor:
+        if self.enabled and self.channels_last and X.dim() == 4:
+            return X.contiguous(memory_format=torch.channels_last)
+        return X
+
+    def autocast(self, device_type: str = "cpu") -> AbstractContextManager:
+        return torch.autocast(
+            device_type=device_type,
+            dtype=torch.bfloat16,
+            enabled=self.enabled and self.bf16
+        )
+
+
+class MetricsAccumulator:
+    '''
+    Running sums of the segmentation metrics. The sums are kept as tensors on
+    the device of the predictions and are moved to the host only by
+    `compute`, so the updates don't synchronize the device with the host.
+
+    Parameters
+    ----------
+    n_classes: int|None
+        Number of the classes, taken from the predictions if not specified.
+    '''
+    def __init__(self, n_classes: int|None = None) -> None:
+        self.n_classes = n_classes
+        self.reset()
+
+    def reset(self) -> None:
+        self.total_pixels = 0
+        self.batches = 0
+        self.correct: torch.Tensor|None = None
+        self.loss_sum: torch.Tensor|None = None
+        # Flattened confusion matrix: target class * n_classes + predicted
+        # class. The last element counts pixels with the target out of the
+        # range of the classes, like `ignore_index` of the loss.
+        self.confusion: torch.Tensor|None = None
+
+    def update(
+        self,
+        predict: torch.Tensor,
+        target: torch.Tensor,
+        loss: torch.Tensor|None = None
+    ) -> None:
+        '''
+        Add the batch to the metrics.
+
+        Parameters
+        ----------
+        predict: torch.Tensor
+            Logits of the model, classes are in the second dimension.
+        target: torch.Tensor
+            Classes of the pixels.
+        loss: torch.Tensor|None
+            Loss on the batch.
+        '''
+        if self.n_classes is None:
+            self.n_classes = predict.shape[1]
+        n = self.n_classes
+        if self.confusion is None:
+            device = predict.device
+            self.correct = torch.zeros((), dtype=torch.int64, device=device)
+            self.loss_sum = torch.zeros((), device=device)
+            self.confusion = torch.zeros(
+                n * n + 1, dtype=torch.int64, device=device
+            )
+
+        labels = predict.argmax(dim=1)
+        self.correct += (labels == target).sum()
+        self.total_pixels += target.numel()
+
+        target = target.long()
+        valid = (target >= 0) & (target < n)
+        index = torch.where(valid, target * n + labels, n * n).flatten()
+        if index.device.type == "cpu":
+            self.confusion += torch.bincount(index, minlength=n * n + 1)
+        else:
+            # Size of the `bincount` output depends on the data, so on the
+            # accelerators it has to read the maximum on the host.
+            self.confusion.index_add_(0, index, torch.ones_like(index))
+
+        if loss is not None:
+            self.loss_sum += loss.detach().float()
+            self.batches += 1
+
+    def compute(self) -> dict[str, float|torch.Tensor]:
+        '''
+        Reduce the accumulated sums.
+
+        Returns
+        -------
+        out: dict[str, float|torch.Tensor]
+            - "accuracy": share of the correctly classified pixels.
+            - "loss": average loss over the batches.
+            - "confusion": confusion matrix, rows are the target classes,
+              columns are the predicted classes.
+            - "iou": intersection over union for each class, nan for the
+              classes that are neither in the targets nor in predictions.
+            - "mean_iou": average of the defined "iou".
+        '''
+        if self.confusion is None:
+            raise ValueError("There are no batches in the metrics.")
+        n = self.n_classes
+        confusion = self.confusion[:n * n].view(n, n).cpu()
+        intersection = confusion.diagonal()
+        union = confusion.sum(dim=0) + confusion.sum(dim=1) - intersection
+        iou = intersection / union
+        return {
+            "accuracy": self.correct.item() / self.total_pixels,
+            "loss": self.loss_sum.item() / max(self.batches, 1),
+            "confusion": confusion,
+            "iou": iou,
+            "mean_iou": iou.nanmean().item()
+        }
+
 
 @torch.inference_mode
 def evaluate(
     model: nn.Module,
     loader: DataLoader,
     loss_fun: Callable,
-    tqdm_desc: str = None
+    tqdm_desc: str = None,
+    fast_path: FastPath|None = None,
+    metrics: MetricsAccumulator|None = None
 ) -> tuple[float, float]:
 
     """
@@ -150,6 +443,11 @@ def evaluate(
         The loss function used for evaluation.  
     tqdm_desc: str  
         The description displayed in the tqdm progress bar for batches.
+    fast_path: FastPath|None
+        Options of the faster execution of the model.
+    metrics: MetricsAccumulator|None
+        Accumulator to collect the metrics to, pass it to get the per class
+        metrics with `metrics.compute()`.
 
     Returns
     -------
@@ -158,38 +456,378 @@ def evaluate(
         - Average loss over the batches of the estimated model.
     """
 
+    fast_path = fast_path or FastPath()
+    metrics = metrics or MetricsAccumulator()
     model.eval()
-
-    total_pixels = 0
-    correct_pixels = 0
-    loss_cumulative = 0
+    model = fast_path.prepare(model)
 
     for X, y in tqdm(loader, desc=tqdm_desc):
 
-        predict = model(X)
-
-        loss_cumulative += loss_fun(input=predict, target=y).item()
+        with fast_path.autocast(X.device.type):
+            predict = model(fast_path.input(X)).float()
 
-        correct_pixels += (predict.argmax(dim=1) == y).sum()
-        total_pixels += y.numel()
+        metrics.update(
+            predict=predict,
+            target=y,
+            loss=loss_fun(input=predict, target=y)
+        )
 
-    return (correct_pixels/total_pixels).item(), loss_cumulative/len(loader)
+    result = metrics.compute()
+    return result["accuracy"], result["loss"]
 
 
 def run_epoch(
     model: nn.Module,
     loader: DataLoader,
     loss_fun: Callable,
+    optimizer: torch.optim.Optimizer,
+    fast_path: FastPath|None = None,
+    accumulation_steps: int = 1,
+    checkpointing: bool|None = None,
+    track_memory: bool = False
+) -> list[int]:
+    '''
+    Fit the model for one epoch.
+
+    Parameters
+    ----------
+    model: nn.Module
+        The model to be fitted.
+    loader: DataLoader
+        The DataLoader with the training data.
+    loss_fun: Callable
+        The loss function, expected to average over the batch.
     optimizer: torch.optim.Optimizer
-):
+        Optimizer of the model parameters.
+    fast_path: FastPath|None
+        Options of the faster execution of the model.
+    accumulation_steps: int
+        Each batch is split into this number of micro-batches, their
+        gradients are accumulated and the optimizer makes one step per batch.
+        Only the activations of a micro-batch are kept in memory. Gradients
+        are the same as for the whole batch, unless the model has batch norm
+        layers: they normalize each micro-batch by its own statistics.
+    checkpointing: bool|None
+        Use activation checkpointing in `Down` and `Up` blocks, see
+        `set_checkpointing`. The model is left as it is if None.
+    track_memory: bool
+        Measure the peak memory of each step.
+
+    Returns
+    -------
+    out: list[int]
+        Peak memory of each step in bytes, empty if `track_memory` is False.
+    '''
+    fast_path = fast_path or FastPath()
+    if checkpointing is not None:
+        set_checkpointing(model, checkpointing)
     model.train()
-    for X, y in tqdm(loader, desc="Fitting"):
+    model = fast_path.prepare(model)
+
+    peaks = []
+    progress = tqdm(loader, desc="Fitting")
+    for X, y in progress:
+        if track_memory:
+            _reset_peak_memory(X.device)
+
         optimizer.zero_grad()
-        predict = model(X)
-        loss_value = loss_fun(input=predict, target=y)
-        loss_value.backward()
+        for X_micro, y_micro in zip(
+            X.chunk(accumulation_steps),
+            y.chunk(accumulation_steps)
+        ):
+            with fast_path.autocast(X.device.type):
+                predict = model(fast_path.input(X_micro))
+            loss_value = loss_fun(input=predict.float(), target=y_micro)
+            # Loss is weighted by the share of the micro-batch, so the
+            # accumulated gradient equals the gradient of the whole batch.
+            (loss_value * len(X_micro) / len(X)).backward()
         optimizer.step()
 
+        if track_memory:
+            peaks.append(peak_memory(X.device))
+            progress.set_postfix(peak_mb=peaks[-1] // 2 ** 20)
+    return peaks
+
+
+def benchmark_fast_paths(
+    model: nn.Module,
+    X: torch.Tensor,
+    y: torch.Tensor,
+    fast_paths: dict[str, FastPath]|None = None,
+    repeat: int = 10
+) -> dict[str, dict[str, float]]:
+    '''
+    Compares the speed of the fast paths with the eager fp32 execution.
+
+    Parameters
+    ----------
+    model: nn.Module
+        The model to be measured, each fast path gets its own copy.
+    X: torch.Tensor
+        Batch of the input images.
+    y: torch.Tensor
+        Target classes of the pixels of the images.
+    fast_paths: dict[str, FastPath]|None
+        The fast paths by their names, "eager" is always measured. By default
+        each option is measured separately and all of them together.
+    repeat: int
+        Number of measured iterations, one more iteration warms up the model.
+
+    Returns
+    -------
+    out: dict[str, dict[str, float]]
+        For each fast path:
+        - "inference": images/sec of the inference.
+        - "training": images/sec of the training steps.
+        - "max_abs_diff": the largest difference of the logits from the eager
+          ones.
+        - "agreement": share of the pixels with the same predicted class as
+          the eager model predicts.
+        - "mean_iou_diff": difference of the mean IoU with `y` from the one of
+          the eager model.
+    '''
+    if fast_paths is None:
+        fast_paths = {
+            "bf16": FastPath(bf16=True),
+            "channels_last": FastPath(channels_last=True),
+            "compile": FastPath(compile=True),
+            "all": FastPath(bf16=True, channels_last=True, compile=True)
+        }
+    fast_paths = {"eager": FastPath(), **fast_paths}
+
+    def images_per_sec(step: Callable[[], None]) -> float:
+        step()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            step()
+        return repeat * len(X) / (time.perf_counter() - start)
+
+    def mean_iou(logits: torch.Tensor) -> float:
+        metrics = MetricsAccumulator()
+        metrics.update(predict=logits, target=y)
+        return metrics.compute()["mean_iou"]
+
+    ans = {}
+    reference = None
+    for name, fast_path in fast_paths.items():
+        fast_model = copy.deepcopy(model)
+        fast_model.eval()
+        prepared = fast_path.prepare(fast_model)
+
+        def infer() -> torch.Tensor:
+            with torch.inference_mode(), fast_path.autocast(X.device.type):
+                return prepared(fast_path.input(X)).float()
+
+        logits = infer()
+        if reference is None:
+            reference = logits
+        result = {
+            "inference": images_per_sec(infer),
+            "max_abs_diff": (logits - reference).abs().max().item(),
+            "agreement": (
+                logits.argmax(dim=1) == reference.argmax(dim=1)
+            ).float().mean().item(),
+            "mean_iou_diff": mean_iou(logits) - mean_iou(reference)
+        }
+
+        fast_model.train()
+        optimizer = torch.optim.SGD(fast_model.parameters(), lr=1e-3)
+
+        def train_step() -> None:
+            optimizer.zero_grad()
+            with fast_path.autocast(X.device.type):
+                predict = prepared(fast_path.input(X))
+            loss = nn.functional.cross_entropy(predict.float(), y)
+            loss.backward()
+            optimizer.step()
+
+        result["training"] = images_per_sec(train_step)
+        ans[name] = result
+    return ans
+
+
+def _tile_starts(size: int, tile: int, stride: int) -> list[int]:
+    '''
+    Starts of the tiles along one dimension. The last tile is aligned with
+    the end, so all tiles have the same size.
+    '''
+    if size <= tile:
+        return [0]
+    starts = list(range(0, size - tile, stride))
+    starts.append(size - tile)
+    return starts
+
+
+def _blend_window(size: int, overlap: int) -> np.ndarray:
+    '''
+    Weights of the tile pixels along one dimension: they grow linearly over
+    the overlap from the edges, so the overlapping tiles fade into each other.
+    '''
+    position = np.arange(size, dtype=np.float32)
+    distance = np.minimum(position + 1, size - position)
+    return np.minimum(distance / (overlap + 1), 1).astype(np.float32)
+
+
+def _prefetch(
+    function: Callable,
+    items: Iterable,
+    num_workers: int
+) -> Iterator[tuple]:
+    '''
+    Pairs of the item and `function(item)` in the order of the items. With
+    workers, results for a few next items are prepared in the threads while
+    the current one is used.
+    '''
+    if num_workers <= 0:
+        for item in items:
+            yield item, function(item)
+        return
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append((item, executor.submit(function, item)))
+            if len(pending) > 2 * num_workers:
+                item, future = pending.popleft()
+                yield item, future.result()
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+
+@torch.inference_mode
+def predict_tiled(
+    model: nn.Module,
+    image: torch.Tensor|np.ndarray,
+    tile_size: int = 256,
+    overlap: int = 32,
+    batch_size: int = 8,
+    num_workers: int = 0,
+    out: np.ndarray|str|Path|None = None,
+    fast_path: FastPath|None = None
+) -> np.ndarray:
+    '''
+    Logits of the model for the image that is too large to be processed at
+    once. The image is split into overlapping tiles, logits of the tiles are
+    blended with the weights that decrease towards the edges of the tiles.
+
+    Tiles don't have to be divisible by the downscaling of the model: `Up`
+    blocks pad the upscaled feature maps to the size of the skip
+    connections, so tiles of any size give logits of the same size.
+
+    Parameters
+    ----------
+    model: nn.Module
+        Segmentation model.
+    image: torch.Tensor|np.ndarray
+        Input of the model for the one image, with the shape (channels,
+        height, width). Only the tiles being processed are read, so it can
+        be `np.memmap`.
+    tile_size: int
+        Height and width of the tiles.
+    overlap: int
+        Number of pixels shared by the neighbouring tiles.
+    batch_size: int
+        Number of tiles passed to the model at once.
+    num_workers: int
+        Number of threads that prepare the next batches of tiles while the
+        model processes the current one, 0 to prepare them in the calling
+        thread.
+    out: np.ndarray|str|Path|None
+        Where to write the logits. A floating point array of the shape
+        (classes, height, width) is filled in place, the path creates the
+        memory-mapped ".npy" file, by default the array is allocated in
+        memory.
+    fast_path: FastPath|None
+        Options of the faster execution of the model.
+
+    Returns
+    -------
+    out: np.ndarray
+        Logits of the image with the shape (classes, height, width).
+    '''
+    if not 0 <= overlap < tile_size:
+        raise ValueError("`overlap` must be less than `tile_size`.")
+    _, height, width = image.shape
+    if isinstance(out, np.ndarray) and (
+        out.ndim != 3
+        or out.shape[1:] != (height, width)
+        or not np.issubdtype(out.dtype, np.floating)
+    ):
+        raise ValueError(
+            f"`out` must be a floating point array of the shape (classes, "
+            f"{height}, {width}), got {out.dtype} array {out.shape}."
+        )
+    fast_path = fast_path or FastPath()
+    model.eval()
+    model = fast_path.prepare(model)
+    device = next(model.parameters()).device
+
+    tile_height, tile_width = min(tile_size, height), min(tile_size, width)
+    stride = tile_size - overlap
+    ys = _tile_starts(height, tile_height, stride)
+    xs = _tile_starts(width, tile_width, stride)
+    positions = [(y, x) for y in ys for x in xs]
+    batches = [
+        positions[i:i + batch_size]
+        for i in range(0, len(positions), batch_size)
+    ]
+
+    window_y = _blend_window(tile_height, overlap)
+    window_x = _blend_window(tile_width, overlap)
+    weight = window_y[:, None] * window_x[None, :]
+
+    def prepare(batch: list[tuple[int, int]]) -> torch.Tensor:
+        tiles = []
+        for y, x in batch:
+            tile = image[:, y:y + tile_height, x:x + tile_width]
+            if isinstance(tile, np.ndarray):
+                tile = torch.from_numpy(np.ascontiguousarray(tile))
+            tiles.append(tile)
+        return torch.stack(tiles).float()
+
+    for batch, tiles in _prefetch(prepare, batches, num_workers):
+        with fast_path.autocast(device.type):
+            logits = model(fast_path.input(tiles.to(device)))
+        logits = logits.float().cpu().numpy()
+
+        if not isinstance(out, np.ndarray):
+            shape = (logits.shape[1], height, width)
+            if out is None:
+                out = np.zeros(shape, dtype=np.float32)
+            else:
+                out = np.lib.format.open_memmap(
+                    out, mode="w+", dtype=np.float32, shape=shape
+                )
+        elif batch is batches[0]:
+            if len(out) != logits.shape[1]:
+                raise ValueError(
+                    f"`out` has {len(out)} classes, the model returns "
+                    f"{logits.shape[1]}."
+                )
+            out[...] = 0
+
+        for (y, x), tile_logits in zip(batch, logits):
+            out[:, y:y + tile_height, x:x + tile_width] += (
+                tile_logits * weight
+            )
+
+    # Weights of the tiles are the products of the weights along the
+    # dimensions, so their sum for each pixel is the product of the sums.
+    total_y = np.zeros(height, dtype=np.float32)
+    for y in ys:
+        total_y[y:y + tile_height] += window_y
+    total_x = np.zeros(width, dtype=np.float32)
+    for x in xs:
+        total_x[x:x + tile_width] += window_x
+    for y in range(0, height, tile_height):
+        out[:, y:y + tile_height] /= (
+            total_y[y:y + tile_height, None] * total_x[None, :]
+        )
+
+    if isinstance(out, np.memmap):
+        out.flush()
+    return out
+
 
 hf_api = huggingface_hub.HfApi()
 def save_model(model: torch.nn.Module, name: str):